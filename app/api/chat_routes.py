@@ -1,20 +1,66 @@
-from typing import List
+from typing import List, Optional
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
 from app.core.auth import get_current_user
+from app.core.config import settings
 from app.core.containers import Container
+from app.core.pagination import decode_cursor, encode_cursor
+from app.core.websocket_manager import ConnectionManager, chat_messages_adapter
 from app.models.user import User
-from app.repositories.chat_repository import ChatRepository
+from app.repositories.chat_repository import ChatRepository, resolve_participant_ids
 from app.repositories.message_repository import MessageRepository
 from app.repositories.user_repository import UserRepository
-from app.schemas.chat import ChatCreate, ChatResponse
-from app.schemas.message import MessageResponse
+from app.schemas.chat import ChatCreate, ChatResponse, ChatSummaryResponse
+from app.schemas.message import MessageHistoryResponse, MessageResponse
 
 router = APIRouter(prefix="/chats", tags=["chats"])
 
 
+@router.get("/", response_model=List[ChatSummaryResponse])
+@inject
+async def list_chats(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    chat_repository: ChatRepository = Depends(Provide[Container.chat_repository]),
+    message_repository: MessageRepository = Depends(Provide[Container.message_repository]),
+):
+    """
+    List the current user's chats, most recently active first.
+
+    Every chat comes with its participant IDs, newest message and the number of unread
+    messages from other participants. The page is built with three queries however many
+    chats and messages there are.
+    """
+    chats = await chat_repository.list_inbox_rows(
+        current_user.id, limit=limit, offset=offset, unread_limit=settings.INBOX_UNREAD_LIMIT,
+    )
+    chat_ids = [chat.id for chat in chats]
+    participants = await chat_repository.get_participant_ids(chat_ids)
+    last_messages = await message_repository.get_rows_by_ids(
+        [chat.last_message_id for chat in chats if chat.last_message_id is not None]
+    )
+
+    return [
+        ChatSummaryResponse(
+            id=chat.id,
+            name=chat.name,
+            type=chat.type,
+            participant_ids=participants[chat.id],
+            creator_id=chat.creator_id,
+            last_read_message_id=chat.last_read_message_id,
+            unread_count=chat.unread_count,
+            last_message=(
+                MessageResponse.model_validate(last_messages[chat.last_message_id])
+                if chat.last_message_id in last_messages else None
+            ),
+        )
+        for chat in chats
+    ]
+
+
 @router.post("/", response_model=ChatResponse)
 @inject
 async def create_chat(
@@ -24,46 +70,52 @@ async def create_chat(
         user_repository: UserRepository = Depends(Provide[Container.user_repository]),
 ):
     """Create a new chat"""
-    # Verify all participants exist
+    try:
+        member_ids = resolve_participant_ids(chat_data.type, chat_data.participant_ids, chat_data.creator_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Verify all participants and the creator exist with one query
+    requested_ids = set(member_ids)
+    if chat_data.creator_id:
+        requested_ids.add(chat_data.creator_id)
+    existing_ids = await user_repository.get_existing_ids(requested_ids)
+
     for user_id in chat_data.participant_ids:
-        user = await user_repository.get_by_id(user_id)
-        if not user:
+        if user_id not in existing_ids:
             raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
 
-    # Verify creator exists if provided
-    if chat_data.creator_id:
-        creator = await user_repository.get_by_id(chat_data.creator_id)
-        if not creator:
-            raise HTTPException(status_code=404, detail=f"Creator with ID {chat_data.creator_id} not found")
+    if chat_data.creator_id and chat_data.creator_id not in existing_ids:
+        raise HTTPException(status_code=404, detail=f"Creator with ID {chat_data.creator_id} not found")
 
-    try:
-        chat = await chat_repository.create(
-            name=chat_data.name,
-            type_=chat_data.type,
-            participant_ids=chat_data.participant_ids,
-            creator_id=chat_data.creator_id,
-            load_relationships=True
-        )
-        return ChatResponse(
-            id=chat.id,
-            name=chat.name,
-            type=chat.type,
-            participant_ids=[p.user_id for p in chat.participants],
-            creator_id=chat.creator_id
-        )
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    # The response is built from the request, nothing is read back
+    chat = await chat_repository.create(
+        name=chat_data.name,
+        type_=chat_data.type,
+        participant_ids=member_ids,
+        creator_id=chat_data.creator_id,
+    )
+    return ChatResponse(
+        id=chat.id,
+        name=chat.name,
+        type=chat.type,
+        participant_ids=member_ids,
+        creator_id=chat.creator_id
+    )
 
 
-@router.get("/history/{chat_id}", response_model=List[MessageResponse])
+@router.get("/history/{chat_id}", response_model=MessageHistoryResponse)
 @inject
 async def get_chat_history(
     chat_id: int,
-    limit: int = 50,
-    offset: int = 0,
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     chat_repository: ChatRepository = Depends(Provide[Container.chat_repository]),
     message_repository: MessageRepository = Depends(Provide[Container.message_repository]),
+    connection_manager: ConnectionManager = Depends(Provide[Container.connection_manager]),
 ):
     """
     Get the message history for a specific chat.
@@ -71,33 +123,65 @@ async def get_chat_history(
     Parameters:
     - chat_id: ID of the chat
     - limit: Maximum number of messages to return (default: 50)
-    - offset: Number of messages to skip (default: 0)
+    - before_id: Return messages older than this message ID
+    - after_id: Return messages newer than this message ID
+    - cursor: Opaque cursor from a previous response, overrides before_id/after_id
     
     Returns:
-    - List of messages sorted by timestamp (ascending)
+    - Page of messages sorted by ID (ascending), the newest page if no cursor is given,
+      with cursors for the older and newer pages
     """
-    chat = await chat_repository.get_by_id(chat_id, load_relationships=True)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
-    
-    is_participant = False
-    for participant in chat.participants:
-        if participant.user_id == current_user.id:
-            is_participant = True
-            break
-    
-    if not is_participant:
+    if cursor is not None:
+        try:
+            position = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        before_id = position.get("before_id")
+        after_id = position.get("after_id")
+
+    if not await chat_repository.is_participant(chat_id, current_user.id):
+        if not await chat_repository.exists(chat_id):
+            raise HTTPException(status_code=404, detail="Chat not found")
         raise HTTPException(
             status_code=403, 
             detail="You do not have access to this chat's history"
         )
     
-    messages = await message_repository.get_history(
-        chat_id=chat_id,
-        limit=limit,
-        offset=offset,
-        load_relationships=True
-    )
-    
-    return messages
+    newest_page = before_id is None and after_id is None
+    cached = connection_manager.recent_history(chat_id, limit) if newest_page else None
+    if cached is not None:
+        # Served from the in-memory buffer of a chat with sockets on this worker
+        messages = [
+            MessageResponse(
+                id=message.id,
+                sender_id=message.sender_id,
+                chat_id=chat_id,
+                text=message.content,
+                timestamp=message.timestamp,
+                is_read=message.is_read,
+            )
+            for message in chat_messages_adapter.validate_json(f"[{','.join(cached)}]")
+        ]
+    else:
+        # Only seeds the buffer if the chat's channel was subscribed before the page is read
+        marker = connection_manager.history_seed_marker(chat_id) if newest_page else None
+        rows = await message_repository.get_history_rows(
+            chat_id=chat_id,
+            limit=limit,
+            before_id=before_id,
+            after_id=after_id,
+        )
+        connection_manager.seed_history(chat_id, rows, limit, marker)
+        messages = [MessageResponse.model_validate(row) for row in rows]
 
+    older_cursor = newer_cursor = None
+    if messages:
+        if len(messages) == limit or after_id is not None:
+            older_cursor = encode_cursor(before_id=messages[0].id)
+        newer_cursor = encode_cursor(after_id=messages[-1].id)
+    
+    return MessageHistoryResponse(
+        messages=messages,
+        older_cursor=older_cursor,
+        newer_cursor=newer_cursor,
+    )
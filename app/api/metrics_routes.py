@@ -0,0 +1,75 @@
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.core.containers import Container
+from app.core.db import pool_metrics
+from app.core.metrics import REGISTRY
+from app.core.websocket_manager import ConnectionManager
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+def register_collectors(container: Container):
+    """Expose the state of the per-worker singletons, read only when /metrics is scraped"""
+    connection_manager = container.connection_manager()
+    membership_cache = container.membership_cache()
+    token_cache = container.token_cache()
+    message_writer = container.message_writer()
+    read_receipts = container.read_receipts()
+    password_hasher = container.password_hasher()
+
+    REGISTRY.gauge_callback("ws_active_sockets", "WebSockets connected to this worker", connection_manager.local_socket_count)
+    REGISTRY.gauge_callback("ws_active_chats", "Chats with at least one local socket", lambda: len(connection_manager.chat_connections))
+    REGISTRY.gauge_callback("ws_subscriptions", "Broadcast channels this worker is subscribed to", connection_manager.subscription_count)
+    REGISTRY.gauge_callback(
+        "ws_send_backlog", "Frames queued for sending across all local sockets",
+        lambda: sum(connection.backlog for connection in connection_manager.connections.values()),
+    )
+    REGISTRY.gauge_callback(
+        "ws_send_backlog_max", "Largest send queue of a single local socket",
+        lambda: max((connection.backlog for connection in connection_manager.connections.values()), default=0),
+    )
+    REGISTRY.gauge_callback("membership_cache", "Chat membership cache state", membership_cache.stats, label="stat")
+    REGISTRY.gauge_callback("token_cache", "JWT claims cache state", token_cache.stats, label="stat")
+    history_cache = container.history_cache()
+    if history_cache is not None:
+        REGISTRY.gauge_callback("history_cache", "Recent message cache state", history_cache.stats, label="stat")
+    REGISTRY.gauge_callback("message_stream", "Per-chat message stream state", container.message_stream().stats, label="stat")
+    REGISTRY.gauge_callback("message_partitions", "Messages table partition state", container.partition_manager().stats, label="stat")
+    message_archive = container.message_archive()
+    if message_archive is not None:
+        REGISTRY.gauge_callback("message_archive", "Archived message partitions", message_archive.stats, label="stat")
+    if message_writer.generates_ids:
+        REGISTRY.gauge_callback("message_ids", "Snowflake ID generator state", container.id_generator().stats, label="stat")
+    REGISTRY.gauge_callback("message_writer", "Batching message writer state", message_writer.stats, label="stat")
+    REGISTRY.gauge_callback("read_receipts", "Read receipt coalescer state", read_receipts.stats, label="stat")
+    REGISTRY.gauge_callback("password_hasher", "Password hashing pool state", password_hasher.stats, label="stat")
+    REGISTRY.gauge_callback(
+        "db_pool", "Database connection pool state",
+        lambda: {key: value for key, value in pool_metrics.snapshot().items() if key != "wait_seconds"},
+        label="stat",
+    )
+
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics of this worker in the Prometheus text format"""
+    if not REGISTRY.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/sockets")
+@inject
+async def get_socket_metrics(
+    connection_manager: ConnectionManager = Depends(Provide[Container.connection_manager]),
+):
+    """Outbound backlog of every WebSocket connected to this worker, largest first"""
+    return sorted(connection_manager.backlog_stats(), key=lambda stats: stats["backlog"], reverse=True)
+
+
+@router.get("/pool")
+async def get_pool_metrics():
+    """Database connection pool usage of this worker"""
+    return pool_metrics.snapshot()
@@ -0,0 +1,83 @@
+from typing import Optional
+
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.core.auth import get_current_user
+from app.core.containers import Container
+from app.core.pagination import decode_cursor, encode_cursor
+from app.models.user import User
+from app.repositories.chat_repository import ChatRepository
+from app.repositories.message_repository import MessageRepository
+from app.schemas.message import SearchResponse, SearchResult
+
+router = APIRouter(tags=["search"])
+
+
+@router.get("/chats/{chat_id}/search", response_model=SearchResponse)
+@inject
+async def search_chat(
+    chat_id: int,
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    highlight: bool = True,
+    current_user: User = Depends(get_current_user),
+    chat_repository: ChatRepository = Depends(Provide[Container.chat_repository]),
+    message_repository: MessageRepository = Depends(Provide[Container.message_repository]),
+):
+    """
+    Search the messages of a chat.
+
+    Parameters:
+    - q: Search query, supports "quoted phrases", OR and -excluded words
+    - limit: Maximum number of results (default: 20)
+    - cursor: Opaque cursor from a previous response
+    - highlight: Whether to return HTML-escaped snippets with the matches wrapped in <mark> tags
+
+    Returns:
+    - Page of messages, best matches first, with a cursor for the next page
+    """
+    before = parse_search_cursor(cursor)
+
+    if not await chat_repository.is_participant(chat_id, current_user.id):
+        if not await chat_repository.exists(chat_id):
+            raise HTTPException(status_code=404, detail="Chat not found")
+        raise HTTPException(status_code=403, detail="You do not have access to this chat")
+
+    rows = await message_repository.search(q, chat_id=chat_id, limit=limit, before=before, highlight=highlight)
+    return search_response(rows, limit)
+
+
+@router.get("/search", response_model=SearchResponse)
+@inject
+async def search_all_chats(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    highlight: bool = True,
+    current_user: User = Depends(get_current_user),
+    message_repository: MessageRepository = Depends(Provide[Container.message_repository]),
+):
+    """Search the messages of every chat of the current user, same parameters as the chat search"""
+    before = parse_search_cursor(cursor)
+    rows = await message_repository.search(q, user_id=current_user.id, limit=limit, before=before, highlight=highlight)
+    return search_response(rows, limit)
+
+
+def parse_search_cursor(cursor: Optional[str]) -> Optional[tuple[int, int]]:
+    if cursor is None:
+        return None
+    try:
+        position = decode_cursor(cursor)
+        return position["score"], position["before_id"]
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def search_response(rows, limit: int) -> SearchResponse:
+    results = [SearchResult.model_validate(row) for row in rows]
+    next_cursor = None
+    if len(results) == limit:
+        next_cursor = encode_cursor(score=results[-1].score, before_id=results[-1].id)
+    return SearchResponse(results=results, next_cursor=next_cursor)
@@ -4,9 +4,10 @@ from dependency_injector.wiring import inject, Provide
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app.core.auth import create_access_token, get_current_user
+from app.core.auth import create_access_token, get_current_user, oauth2_scheme
 from app.core.config import settings
 from app.core.containers import Container
+from app.core.token_cache import TokenCache
 from app.models.user import User
 from app.schemas.user import UserCreate, UserResponse, Token, UserLogin
 from app.services.user_service import UserService
@@ -72,7 +73,7 @@ async def login_for_access_token(
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data={"sub": str(user.id), "name": user.name, "email": user.email}, expires_delta=access_token_expires
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
@@ -95,7 +96,7 @@ async def login(
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data={"sub": str(user.id), "name": user.name, "email": user.email}, expires_delta=access_token_expires
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
@@ -109,3 +110,15 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
         name=current_user.name,
         email=current_user.email
     )
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+@inject
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_user),
+    token_cache: TokenCache = Depends(Provide[Container.token_cache]),
+):
+    """Revoke the current access token on every worker"""
+    claims = token_cache.decode(token)
+    await token_cache.revoke_token(token, exp=claims["exp"])
@@ -1,20 +1,28 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
 from dependency_injector.wiring import inject, Provide
-import json
-from typing import Dict, Any
-from pydantic import ValidationError
+from typing import List, Optional
 
+from app.core.codec import decode_client_frame, receive_client_data
+from app.core.config import settings
 from app.core.containers import Container
+from app.core.message_stream import MessageStream
+from app.core.metrics import ws_messages_in
+from app.core.snowflake import WorkerIdLostError
+from app.core.token_cache import TokenCache
 from app.core.websocket_manager import ConnectionManager
 from app.core.websocket_auth import get_user_from_token
 from app.repositories.chat_repository import ChatRepository
 from app.repositories.message_repository import MessageRepository
 from app.repositories.user_repository import UserRepository
+from app.services.message_writer import MessageWriter, text_error
+from app.services.read_receipts import ReadReceiptCoalescer
 from app.schemas.websocket_messages import (
-    MessageType, 
-    ChatMessageIn, 
-    ChatMessageOut, 
-    ReadStatusIn
+    ClientFrame,
+    ChatMessageIn,
+    ChatMessageOut,
+    ReadStatusIn,
+    SubscribeIn,
+    UnsubscribeIn,
 )
 
 router = APIRouter()
@@ -28,94 +36,224 @@ async def websocket_endpoint(
     message_repository: MessageRepository = Depends(Provide[Container.message_repository]),
     user_repository: UserRepository = Depends(Provide[Container.user_repository]),
     connection_manager: ConnectionManager = Depends(Provide[Container.connection_manager]),
+    message_writer: MessageWriter = Depends(Provide[Container.message_writer]),
+    read_receipts: ReadReceiptCoalescer = Depends(Provide[Container.read_receipts]),
+    token_cache: TokenCache = Depends(Provide[Container.token_cache]),
+    message_stream: MessageStream = Depends(Provide[Container.message_stream]),
+    resume_from: Optional[int] = None,
 ):
     # Get user from token
-    user = await get_user_from_token(websocket, user_repository)
+    user = await get_user_from_token(websocket, user_repository, token_cache)
     if not user:
         return
 
     user_id = user.id
 
-    # Get chat with participants loaded to verify membership
-    chat = await chat_repository.get_by_id(chat_id, load_relationships=True)
-    if not chat:
-        await websocket.close(code=1008, reason="Chat not found")
-        return
-
-    for participant in chat.participants:
-        if participant.user_id == user_id:
-            break
-    else:
-        await websocket.close(code=1008, reason="User is not a participant in this chat")
+    # Verify membership without loading the chat
+    if not await chat_repository.is_participant(chat_id, user_id):
+        if not await chat_repository.exists(chat_id):
+            await websocket.close(code=1008, reason="Chat not found")
+        else:
+            await websocket.close(code=1008, reason="User is not a participant in this chat")
         return
 
     # Accept the connection and add it to the manager
     await connection_manager.connect(websocket, chat_id)
 
     try:
-        # Send chat history to the user, load sender information
-        chat_history = await message_repository.get_history(chat_id, load_relationships=True)
-        for message in chat_history:
-            message_model = ChatMessageOut(
-                id=message.id,
-                sender_id=message.sender_id,
-                content=message.text,
-                timestamp=message.timestamp,
-                is_read=message.is_read
-            )
-            await websocket.send_text(message_model.model_dump_json())
+        await send_chat_history(websocket, chat_id, resume_from, connection_manager, message_repository, message_stream)
 
         # Listen for messages from this client
         while True:
-            data = await websocket.receive_text()
+            data = await receive_client_data(websocket)
+            ws_messages_in.inc()
             try:
-                json_data = json.loads(data)
-                message_type = json_data.get("type")
+                frame = decode_client_frame(data)
+                await handle_chat_frame(
+                    websocket, frame, chat_id, user_id, connection_manager, message_writer, read_receipts,
+                )
+
+            except ValueError:
+                # Invalid JSON, MessagePack or message format, ignore
+                continue
+            except Exception as e:
+                print(f"Error processing message: {str(e)}")
+
+    except WebSocketDisconnect:
+        # Client disconnected
+        pass
+    finally:
+        # Also on errors, so the connection, its writer and subscriptions are released
+        await connection_manager.disconnect(websocket)
+
+
+@router.websocket("/ws")
+@inject
+async def multiplexed_websocket_endpoint(
+    websocket: WebSocket,
+    chat_repository: ChatRepository = Depends(Provide[Container.chat_repository]),
+    message_repository: MessageRepository = Depends(Provide[Container.message_repository]),
+    user_repository: UserRepository = Depends(Provide[Container.user_repository]),
+    connection_manager: ConnectionManager = Depends(Provide[Container.connection_manager]),
+    message_writer: MessageWriter = Depends(Provide[Container.message_writer]),
+    read_receipts: ReadReceiptCoalescer = Depends(Provide[Container.read_receipts]),
+    token_cache: TokenCache = Depends(Provide[Container.token_cache]),
+    message_stream: MessageStream = Depends(Provide[Container.message_stream]),
+    chat_id: Optional[List[int]] = Query(None),
+):
+    """
+    One socket for many chats.
+
+    Subscribes to every chat of the user, or to the chats given as repeated chat_id
+    query parameters, up to WS_MAX_CHATS_PER_SOCKET, every chat beyond that gets an error frame.
+    Every frame carries chat_id, frames from the client must set it too.
+    Chats can be added and removed with subscribe and unsubscribe frames, history is sent
+    only for chats subscribed that way.
+    """
+    user = await get_user_from_token(websocket, user_repository, token_cache)
+    if not user:
+        return
+
+    user_id = user.id
+
+    # One query for the whole set, chats the user is not in are skipped
+    chat_ids = await chat_repository.list_chat_ids(user_id, chat_id)
+    await connection_manager.connect(websocket)
 
-                if message_type == MessageType.MESSAGE:
-                    message_in = ChatMessageIn.model_validate(json_data)
-                    if not message_in.content.strip():
+    try:
+        await connection_manager.subscribe(websocket, chat_ids[:settings.WS_MAX_CHATS_PER_SOCKET])
+        for dropped_chat_id in chat_ids[settings.WS_MAX_CHATS_PER_SOCKET:]:
+            connection_manager.send_error(websocket, "Too many chats on one socket", dropped_chat_id)
+        connection = connection_manager.get_connection(websocket)
+
+        while True:
+            data = await receive_client_data(websocket)
+            ws_messages_in.inc()
+            try:
+                frame = decode_client_frame(data)
+
+                if isinstance(frame, SubscribeIn):
+                    if frame.chat_id in connection.chat_ids:
                         continue
-                    # Create message with relationships for the broadcast
-                    new_message = await message_repository.create(
-                        chat_id=chat_id,
-                        sender_id=user_id,
-                        text=message_in.content,
-                        load_relationships=True
-                    )
-                    message_out = ChatMessageOut(
-                        id=new_message.id,
-                        sender_id=new_message.sender_id,
-                        content=new_message.text,
-                        timestamp=new_message.timestamp,
-                        is_read=new_message.is_read
+                    if len(connection.chat_ids) >= settings.WS_MAX_CHATS_PER_SOCKET:
+                        connection_manager.send_error(websocket, "Too many chats on one socket", frame.chat_id)
+                        continue
+                    if not await chat_repository.is_participant(frame.chat_id, user_id):
+                        connection_manager.send_error(websocket, "Not a participant in this chat", frame.chat_id)
+                        continue
+                    await connection_manager.subscribe(websocket, [frame.chat_id])
+                    await send_chat_history(
+                        websocket, frame.chat_id, frame.resume_from,
+                        connection_manager, message_repository, message_stream,
                     )
 
-                    await connection_manager.broadcast_message(chat_id, message_out)
+                elif isinstance(frame, UnsubscribeIn):
+                    connection_manager.unsubscribe(websocket, frame.chat_id)
 
-                elif message_type == MessageType.READ_STATUS:
-                    read_status = ReadStatusIn.model_validate(json_data)
-                    # Mark as read with relationships loaded
-                    updated_message = await message_repository.mark_as_read(
-                        read_status.message_id,
-                        load_relationships=True
+                else:
+                    if frame.chat_id not in connection.chat_ids:
+                        connection_manager.send_error(websocket, "Not subscribed to this chat", frame.chat_id)
+                        continue
+                    await handle_chat_frame(
+                        websocket, frame, frame.chat_id, user_id, connection_manager, message_writer, read_receipts,
                     )
-                    if updated_message:
-                        await connection_manager.broadcast_read_status(
-                            message_id=updated_message.id,
-                            chat_id=chat_id,
-                            reader_id=user_id
-                        )
-
-            except json.JSONDecodeError:
-                # Invalid JSON, ignore
-                continue
-            except ValidationError:
-                # Invalid message format, ignore
+
+            except ValueError:
+                # Invalid JSON, MessagePack or message format, ignore
                 continue
             except Exception as e:
                 print(f"Error processing message: {str(e)}")
 
     except WebSocketDisconnect:
         # Client disconnected
+        pass
+    finally:
+        # Also on errors, so the connection, its writer and subscriptions are released
         await connection_manager.disconnect(websocket)
+
+
+async def send_chat_history(
+        websocket: WebSocket,
+        chat_id: int,
+        resume_from: Optional[int],
+        connection_manager: ConnectionManager,
+        message_repository: MessageRepository,
+        message_stream: MessageStream,
+):
+    """Queue the newest history of a chat, or only the messages after resume_from"""
+    if resume_from is None:
+        # Send chat history to the user in one batched frame (or chunks), from memory if possible
+        cached = connection_manager.recent_history(chat_id, settings.WS_HISTORY_LIMIT)
+        if cached is not None:
+            connection_manager.send_replay(websocket, chat_id, cached, chunk_size=settings.WS_HISTORY_CHUNK_SIZE)
+        else:
+            marker = connection_manager.history_seed_marker(chat_id)
+            chat_history = await message_repository.get_history_rows(chat_id, limit=settings.WS_HISTORY_LIMIT)
+            connection_manager.send_history(websocket, chat_id, chat_history, chunk_size=settings.WS_HISTORY_CHUNK_SIZE)
+            connection_manager.seed_history(chat_id, chat_history, settings.WS_HISTORY_LIMIT, marker)
+        return
+
+    # Send only the messages after the last one the client has seen
+    missed = await message_stream.read_after(chat_id, resume_from)
+    if missed is not None:
+        connection_manager.send_replay(websocket, chat_id, missed)
+    else:
+        chat_history = await message_repository.get_history_rows(
+            chat_id, limit=settings.WS_RESUME_LIMIT, after_id=resume_from,
+        )
+        connection_manager.send_history(websocket, chat_id, chat_history, chunk_size=settings.WS_HISTORY_CHUNK_SIZE)
+
+
+async def handle_chat_frame(
+        websocket: WebSocket,
+        frame: ClientFrame,
+        chat_id: int,
+        user_id: int,
+        connection_manager: ConnectionManager,
+        message_writer: MessageWriter,
+        read_receipts: ReadReceiptCoalescer,
+):
+    """Handle a chat message or read status frame sent by a participant of the chat"""
+    if isinstance(frame, ChatMessageIn):
+        if not frame.content.strip():
+            return
+        # Checked before queueing, the database would reject the message after it was broadcast
+        error = text_error(frame.content)
+        if error is None and not connection_manager.message_fits(chat_id, user_id, frame.content):
+            error = "Message is too large for the broadcast backend"
+        if error is not None:
+            connection_manager.send_error(websocket, error, chat_id)
+            return
+        if message_writer.generates_ids:
+            # ID and timestamp are assigned in-process, the message is broadcast before it is stored
+            try:
+                created = message_writer.enqueue(chat_id=chat_id, sender_id=user_id, text=frame.content)
+            except WorkerIdLostError:
+                connection_manager.send_error(websocket, "Messages cannot be sent right now, try again later", chat_id)
+                return
+        else:
+            # Stored by the batching writer, only id and timestamp come back
+            try:
+                created = await message_writer.submit(
+                    chat_id=chat_id,
+                    sender_id=user_id,
+                    text=frame.content,
+                )
+            except Exception as e:
+                print(f"Error storing message: {str(e)}")
+                connection_manager.send_error(websocket, "Message could not be stored", chat_id)
+                return
+        message_out = ChatMessageOut(
+            id=created.id,
+            sender_id=user_id,
+            content=frame.content,
+            timestamp=created.timestamp,
+            is_read=False,
+            chat_id=chat_id,
+        )
+
+        await connection_manager.broadcast_message(chat_id, message_out)
+
+    elif isinstance(frame, ReadStatusIn):
+        # Coalesced into the user's read watermark and broadcast as "read up to"
+        read_receipts.submit(chat_id, user_id, frame.message_id)
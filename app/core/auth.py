@@ -5,26 +5,17 @@ from dependency_injector.wiring import Provide, inject
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from app.core.config import settings
 from app.core.containers import Container
+from app.core.hashing import get_password_hash, verify_password  # noqa: F401
+from app.core.token_cache import TokenCache
 from app.models.user import User
 from app.repositories.user_repository import UserRepository
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/token")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
 
@@ -33,16 +24,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.now(UTC) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.now(UTC)})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
     return encoded_jwt
 
 
+def user_from_claims(claims: dict) -> Optional[User]:
+    """Build a detached User from token claims, if they carry everything the routes need"""
+    if not all(key in claims for key in ("sub", "name", "email")):
+        return None
+    return User(id=int(claims["sub"]), name=claims["name"], email=claims["email"])
+
+
 @inject
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
-        user_repository: UserRepository = Depends(Provide[Container.user_repository])
+        user_repository: UserRepository = Depends(Provide[Container.user_repository]),
+        token_cache: TokenCache = Depends(Provide[Container.token_cache]),
 ) -> User:
     """Get the current user from the token."""
     credentials_exception = HTTPException(
@@ -52,7 +51,7 @@ async def get_current_user(
     )
 
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = token_cache.decode(token)
         user_id: str = payload.get("sub")
 
         if user_id is None:
@@ -60,6 +59,11 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
+    if token_cache.trust_claims:
+        user = user_from_claims(payload)
+        if user is not None:
+            return user
+
     user = await user_repository.get_by_id(int(user_id))
 
     if user is None:
@@ -0,0 +1,167 @@
+import asyncio
+import time
+from asyncio import CancelledError
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Set, Union
+
+from fastapi import WebSocket, status
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from app.core.metrics import ws_delivery_seconds, ws_messages_out
+
+
+class SlowConsumerPolicy(str, Enum):
+    """What to do when a client's outbound queue is full"""
+    DROP_OLDEST = "drop_oldest"
+    DISCONNECT = "disconnect"
+
+
+class ClientConnection:
+    """
+    Outbound side of a single WebSocket.
+
+    Frames are put into a fixed-size queue and sent by a dedicated writer task, so a
+    stalled client never blocks the chat fan-out and never grows memory without bound.
+    Read status frames with the same coalesce key replace each other while queued.
+    Binary connections are sent bytes payloads as binary frames, the rest text frames.
+    """
+
+    def __init__(
+            self,
+            websocket: WebSocket,
+            max_queue_size: int = 256,
+            policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+            coalesce_read_status: bool = True,
+            max_backlog_ms: int = 0,
+            on_close: Optional[Callable[["ClientConnection"], None]] = None,
+            binary: bool = False,
+    ):
+        self.websocket = websocket
+        self.binary = binary
+        self.chat_ids: Set[int] = set()
+        self.max_queue_size = max_queue_size
+        self.policy = SlowConsumerPolicy(policy)
+        self.coalesce_read_status = coalesce_read_status
+        self.max_backlog_ms = max_backlog_ms
+        self.on_close = on_close
+
+        # Entries are [enqueued_at, coalesce_key, payload] lists so coalescing can update them in place
+        self.queue: Deque[List] = deque()
+        self.pending: Dict[Hashable, List] = {}
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+
+        self._ready = asyncio.Event()
+        self._close_task: Optional[asyncio.Task] = None
+        self.writer_task = asyncio.create_task(self._writer())
+
+    @property
+    def backlog(self) -> int:
+        """Number of frames waiting to be sent"""
+        return len(self.queue)
+
+    @property
+    def backlog_ms(self) -> float:
+        """Age of the oldest queued frame in milliseconds"""
+        if not self.queue:
+            return 0.0
+        return (time.monotonic() - self.queue[0][0]) * 1000
+
+    def stats(self) -> dict:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "chat_ids": sorted(self.chat_ids),
+            "backlog": self.backlog,
+            "backlog_ms": round(self.backlog_ms, 1),
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    def enqueue(self, payload: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> bool:
+        """Queue a frame for sending. Returns False if the frame was not accepted."""
+        if self.closed:
+            return False
+
+        if coalesce_key is not None and self.coalesce_read_status:
+            entry = self.pending.get(coalesce_key)
+            if entry is not None:
+                entry[2] = payload
+                self.coalesced += 1
+                return True
+
+        if self.max_backlog_ms and self.backlog_ms > self.max_backlog_ms:
+            self.abort(reason="Backlog too old")
+            return False
+
+        if len(self.queue) >= self.max_queue_size:
+            if self.policy == SlowConsumerPolicy.DISCONNECT:
+                self.abort(reason="Send queue full")
+                return False
+            dropped = self.queue.popleft()
+            self._forget(dropped)
+            self.dropped += 1
+
+        entry = [time.monotonic(), coalesce_key, payload]
+        self.queue.append(entry)
+        if coalesce_key is not None and self.coalesce_read_status:
+            self.pending[coalesce_key] = entry
+        self._ready.set()
+        return True
+
+    def _forget(self, entry: List):
+        key = entry[1]
+        if key is not None and self.pending.get(key) is entry:
+            del self.pending[key]
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                entry = self.queue.popleft()
+                self._forget(entry)
+                send = self.websocket.send_bytes(entry[2]) if self.binary else self.websocket.send_text(entry[2])
+                if self.max_backlog_ms:
+                    # A stalled client stops draining the queue without any new frame arriving,
+                    # so the age of the frame being sent is checked here as well
+                    remaining = self.max_backlog_ms / 1000 - (time.monotonic() - entry[0])
+                    try:
+                        await asyncio.wait_for(send, max(remaining, 0))
+                    except asyncio.TimeoutError:
+                        self.abort(reason="Backlog too old")
+                        return
+                else:
+                    await send
+                ws_messages_out.inc()
+                ws_delivery_seconds.observe(time.monotonic() - entry[0])
+        except CancelledError:
+            pass
+        except (WebSocketDisconnect, RuntimeError):
+            self.abort()
+
+    def abort(self, reason: Optional[str] = None):
+        """Stop sending and close the socket if it is still open"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.pending.clear()
+        if asyncio.current_task() is not self.writer_task:
+            self.writer_task.cancel()
+        if reason is not None:
+            self._close_task = asyncio.create_task(self._close(reason))
+        if self.on_close is not None:
+            self.on_close(self)
+
+    async def _close(self, reason: str):
+        if self.websocket.client_state == WebSocketState.DISCONNECTED:
+            return
+        try:
+            await self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=reason)
+        except RuntimeError:
+            pass
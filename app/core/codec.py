@@ -0,0 +1,133 @@
+import json
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Union
+
+import msgpack
+from fastapi import WebSocket
+from pydantic import BaseModel, TypeAdapter
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+from app.schemas.websocket_messages import ClientFrame
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional
+    msgspec = None
+
+# Inbound frames are parsed and validated in one pass, dispatched on "type"
+client_frame_adapter = TypeAdapter(ClientFrame)
+
+
+class Subprotocol(str, Enum):
+    """WebSocket subprotocols, clients without one get JSON text frames"""
+    JSON = "chat.json.v1"
+    MSGPACK = "chat.msgpack.v1"
+
+
+def negotiate_subprotocol(websocket: WebSocket) -> Optional[Subprotocol]:
+    """The first subprotocol offered by the client that the server supports"""
+    for offered in websocket.scope.get("subprotocols", ()):
+        try:
+            return Subprotocol(offered)
+        except ValueError:
+            continue
+    return None
+
+
+async def receive_client_data(websocket: WebSocket) -> Union[str, bytes]:
+    """
+    Wait for the next text or binary frame.
+
+    Raises:
+        WebSocketDisconnect: If the client disconnected
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    return message["text"]
+
+
+def decode_client_frame(data: Union[str, bytes]) -> ClientFrame:
+    """
+    Parse and validate a frame received from a client, text frames are JSON and binary frames MessagePack.
+
+    Raises:
+        ValueError: If the frame cannot be parsed, has an unknown type or invalid fields
+            (ValidationError is a ValueError)
+    """
+    if isinstance(data, bytes):
+        return client_frame_adapter.validate_python(msgpack.unpackb(data))
+    return client_frame_adapter.validate_json(data)
+
+
+def json_to_msgpack(payload: str) -> bytes:
+    """Re-encode an already-serialized JSON frame for binary clients, timestamps stay ISO strings"""
+    return msgpack.packb(codec.loads(payload))
+
+
+class JsonCodec:
+    """
+    Serializer for outbound models and parser for broadcast payloads.
+
+    Every codec produces compact JSON with the model's field order, so payloads are
+    interchangeable between workers using different codecs.
+    """
+
+    def __init__(self, name: str, dumps: Callable[[BaseModel], str], loads: Callable[[Union[str, bytes]], Any]):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+
+def _pydantic_codec() -> JsonCodec:
+    return JsonCodec("pydantic", lambda model: model.model_dump_json(), json.loads)
+
+
+def _orjson_codec() -> JsonCodec:
+    return JsonCodec(
+        "orjson",
+        lambda model: orjson.dumps(model.model_dump(), option=orjson.OPT_UTC_Z).decode(),
+        orjson.loads,
+    )
+
+
+def _msgspec_codec() -> JsonCodec:
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return JsonCodec("msgspec", lambda model: encoder.encode(model.model_dump()).decode(), decoder.decode)
+
+
+CODECS: Dict[str, Callable[[], JsonCodec]] = {"pydantic": _pydantic_codec}
+if orjson is not None:
+    CODECS["orjson"] = _orjson_codec
+if msgspec is not None:
+    CODECS["msgspec"] = _msgspec_codec
+
+
+def get_codec(name: str = "pydantic") -> JsonCodec:
+    """
+    Codec by name.
+
+    "auto" keeps pydantic's serializer, which avoids building an intermediate dict, and
+    parses with msgspec or orjson when installed (see benchmarks/bench_codec.py).
+
+    Raises:
+        ValueError: If the codec is unknown or its package is not installed
+    """
+    if name == "auto":
+        parser = next(CODECS[candidate]() for candidate in ("msgspec", "orjson", "pydantic") if candidate in CODECS)
+        return JsonCodec(f"auto:{parser.name}", _pydantic_codec().dumps, parser.loads)
+    if name not in CODECS:
+        raise ValueError(f"JSON codec {name!r} is not available, installed: {', '.join(CODECS)}")
+    return CODECS[name]()
+
+
+codec = get_codec(settings.WS_JSON_CODEC)
@@ -4,9 +4,83 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     DATABASE_URL: str
     SECRET_KEY: str
-    REDIS_URL: str
+    REDIS_URL: str = ""
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    TOKEN_CACHE_SIZE: int = 50_000
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False  # skip the user lookup when the token carries id, name and email
+    METRICS_ENABLED: bool = True
+
+    # Database connection pool, per worker
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg prepared statement cache, 0 behind pgbouncer
+
+    # bcrypt runs in a dedicated thread pool, requests beyond the pending limit get 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+
+    # Outbound WebSocket queues
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # drop_oldest or disconnect
+    WS_COALESCE_READ_STATUS: bool = True
+    WS_MAX_BACKLOG_MS: int = 0  # disconnect clients whose oldest queued frame is older than this, 0 disables
+    WS_JSON_CODEC: str = "pydantic"  # pydantic, orjson, msgspec or auto, for outbound frames
+    WS_MAX_CHATS_PER_SOCKET: int = 1000  # chats one multiplexed /ws socket can subscribe to
+
+    # Chat history sent on connect
+    WS_HISTORY_LIMIT: int = 50
+    WS_HISTORY_CHUNK_SIZE: int = 0  # messages per history frame, 0 sends everything in one frame
+
+    # Unread counts in GET /chats are counted up to this many messages per chat
+    INBOX_UNREAD_LIMIT: int = 1000
+
+    # Text search configuration of the messages.search_vector column, fixed when the table is created
+    SEARCH_TEXT_CONFIG: str = "simple"
+
+    # Chat membership cache
+    MEMBERSHIP_CACHE_SIZE: int = 10_000
+    MEMBERSHIP_CACHE_TTL_SECONDS: float = 60.0
+
+    # Write-behind batching of new messages
+    MESSAGE_BATCH_MAX_DELAY_MS: float = 5
+    MESSAGE_BATCH_MAX_SIZE: int = 500
+
+    # Chat pub/sub: memory (single worker), redis or postgres
+    BROADCAST_BACKEND: str = "redis"
+    # Chats are hashed into this many shard channels, 0 keeps one channel per chat
+    CHAT_SHARD_COUNT: int = 0
+    BROADCAST_POOL_SIZE: int = 1  # broadcast connections used for chat traffic, per worker
+
+    # Newest messages of chats with local sockets kept in memory, 0 disables
+    HISTORY_CACHE_MESSAGES: int = 50
+    HISTORY_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # Recent messages kept in a Redis Stream per chat, so reconnects replay only what was missed
+    MESSAGE_STREAM_ENABLED: bool = False
+    MESSAGE_STREAM_MAX_LEN: int = 1000
+    MESSAGE_STREAM_TTL_SECONDS: int = 86400
+    WS_RESUME_LIMIT: int = 500  # most messages sent on resume when falling back to the database
+
+    # Range partitioning of messages by timestamp: day, week or month, empty disables.
+    # PostgreSQL only, applies when the table is created
+    MESSAGE_PARTITION_INTERVAL: str = ""
+    MESSAGE_PARTITIONS_AHEAD: int = 2  # future partitions kept created
+    MESSAGE_PARTITIONS_RETAINED: int = 0  # past partitions kept attached, older ones are detached, 0 keeps all
+    MESSAGE_PARTITION_CHECK_SECONDS: float = 3600
+    # Detached partitions are exported here as gzipped JSON Lines and dropped, history reads them back
+    MESSAGE_ARCHIVE_DIR: str = ""
+
+    # Message IDs: database (serial) or snowflake (generated in-process, messages are broadcast before they are stored)
+    MESSAGE_ID_GENERATOR: str = "database"
+    SNOWFLAKE_WORKER_ID: int = -1  # 0-63, -1 claims a free one with a PostgreSQL advisory lock
+    SNOWFLAKE_LOCK_CHECK_SECONDS: float = 5  # how often a claimed worker ID's lock is checked
+
+    # Read receipts are coalesced for this long before the watermark is stored and broadcast
+    READ_RECEIPT_WINDOW_MS: float = 250
 
     class Config:
         env_file = ".env"
@@ -3,16 +3,27 @@ from broadcaster import Broadcast
 
 from app.core import db
 from app.core.config import settings
+from app.core.hashing import PasswordHasher
+from app.core.history_cache import RecentMessageCache
+from app.core.membership_cache import MembershipCache
+from app.core.message_archive import MessageArchive
+from app.core.message_stream import MessageStream
+from app.core.partitions import MessagePartitionManager
+from app.core.pubsub import BroadcastPool, get_broadcast_url, get_max_payload_bytes
+from app.core.snowflake import SnowflakeGenerator
+from app.core.token_cache import TokenCache
 from app.repositories.user_repository import UserRepository
 from app.repositories.chat_repository import ChatRepository
 from app.repositories.message_repository import MessageRepository
+from app.services.message_writer import MessageWriter
+from app.services.read_receipts import ReadReceiptCoalescer
 from app.services.user_service import UserService
 from app.core.websocket_manager import ConnectionManager
 
 
 class Container(containers.DeclarativeContainer):
     wiring_config = containers.WiringConfiguration(
-        modules=["app.api.user_routes", "app.api.chat_routes", "app.api.websocket_routes", "app.core.auth", "app.core.websocket_manager"]
+        modules=["app.api.user_routes", "app.api.chat_routes", "app.api.search_routes", "app.api.websocket_routes", "app.api.metrics_routes", "app.core.auth", "app.core.websocket_manager"]
     )
 
     config = providers.Configuration()
@@ -22,8 +33,68 @@ class Container(containers.DeclarativeContainer):
     session_factory = providers.Singleton(db.get_session_factory, engine=db_engine)
     db_session = providers.Factory(session_factory)
 
+    # Time partitions of the messages table and the archive of detached ones
+    message_archive = providers.Singleton(
+        MessageArchive,
+        directory=settings.MESSAGE_ARCHIVE_DIR,
+    ) if settings.MESSAGE_ARCHIVE_DIR else providers.Object(None)
+    partition_manager = providers.Singleton(
+        MessagePartitionManager,
+        engine=db_engine,
+        interval=settings.MESSAGE_PARTITION_INTERVAL,
+        ahead=settings.MESSAGE_PARTITIONS_AHEAD,
+        retained=settings.MESSAGE_PARTITIONS_RETAINED,
+        archive=message_archive,
+        check_seconds=settings.MESSAGE_PARTITION_CHECK_SECONDS,
+    )
+
     # Broadcaster for WebSocket pub/sub
-    broadcaster = providers.Singleton(Broadcast, url=settings.REDIS_URL)
+    broadcast_url = providers.Callable(
+        get_broadcast_url,
+        backend=settings.BROADCAST_BACKEND,
+        redis_url=settings.REDIS_URL,
+        database_url=settings.DATABASE_URL,
+    )
+    broadcaster = providers.Singleton(Broadcast, url=broadcast_url)
+    broadcast_pool = providers.Singleton(
+        BroadcastPool,
+        primary=broadcaster,
+        url=broadcast_url,
+        size=settings.BROADCAST_POOL_SIZE,
+    )
+
+    # Recent messages per chat for resuming clients
+    message_stream = providers.Singleton(
+        MessageStream,
+        redis_url=settings.REDIS_URL,
+        max_len=settings.MESSAGE_STREAM_MAX_LEN,
+        ttl_seconds=settings.MESSAGE_STREAM_TTL_SECONDS,
+        enabled=settings.MESSAGE_STREAM_ENABLED,
+    )
+
+    # Newest messages of locally subscribed chats
+    history_cache = providers.Singleton(
+        RecentMessageCache,
+        max_messages=settings.HISTORY_CACHE_MESSAGES,
+        max_bytes=settings.HISTORY_CACHE_MAX_BYTES,
+    ) if settings.HISTORY_CACHE_MESSAGES else providers.Object(None)
+
+    # Chat participants cache, invalidated over the broadcaster
+    membership_cache = providers.Singleton(
+        MembershipCache,
+        broadcast=broadcaster,
+        max_size=settings.MEMBERSHIP_CACHE_SIZE,
+        ttl_seconds=settings.MEMBERSHIP_CACHE_TTL_SECONDS,
+    )
+
+    # Verified JWT claims, revocations are pushed over the broadcaster and stored in Redis
+    token_cache = providers.Singleton(
+        TokenCache,
+        broadcast=broadcaster,
+        max_size=settings.TOKEN_CACHE_SIZE,
+        trust_claims=settings.AUTH_TRUST_TOKEN_CLAIMS,
+        redis_url=settings.REDIS_URL,
+    )
 
     # Repositories
     user_repository = providers.Factory(
@@ -33,20 +104,60 @@ class Container(containers.DeclarativeContainer):
     chat_repository = providers.Factory(
         ChatRepository,
         session_factory=session_factory,
+        membership_cache=membership_cache,
     )
     message_repository = providers.Factory(
         MessageRepository,
         session_factory=session_factory,
+        partitions=partition_manager,
+        archive=message_archive,
     )
 
     # Services
+    password_hasher = providers.Singleton(
+        PasswordHasher,
+        max_workers=settings.PASSWORD_HASH_WORKERS,
+        max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    )
     user_service = providers.Factory(
         UserService,
         user_repository=user_repository,
+        password_hasher=password_hasher,
+    )
+    # The worker ID lock is held on a connection outside the pool
+    id_generator = providers.Singleton(
+        SnowflakeGenerator,
+        engine=providers.Singleton(db.get_engine, pooled=False),
+        worker_id=settings.SNOWFLAKE_WORKER_ID,
+        enabled=settings.MESSAGE_ID_GENERATOR == "snowflake",
+        lock_check_seconds=settings.SNOWFLAKE_LOCK_CHECK_SECONDS,
+    )
+    message_writer = providers.Singleton(
+        MessageWriter,
+        message_repository=message_repository,
+        max_delay_ms=settings.MESSAGE_BATCH_MAX_DELAY_MS,
+        max_batch_size=settings.MESSAGE_BATCH_MAX_SIZE,
+        id_generator=id_generator,
     )
 
     # WebSocket connection manager
     connection_manager = providers.Singleton(
         ConnectionManager,
         broadcast=broadcaster,
+        send_queue_size=settings.WS_SEND_QUEUE_SIZE,
+        slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+        coalesce_read_status=settings.WS_COALESCE_READ_STATUS,
+        max_backlog_ms=settings.WS_MAX_BACKLOG_MS,
+        broadcast_pool=broadcast_pool,
+        shard_count=settings.CHAT_SHARD_COUNT,
+        message_stream=message_stream,
+        history_cache=history_cache,
+        max_payload_bytes=providers.Callable(get_max_payload_bytes, backend=settings.BROADCAST_BACKEND),
+    )
+
+    read_receipts = providers.Singleton(
+        ReadReceiptCoalescer,
+        chat_repository=chat_repository,
+        connection_manager=connection_manager,
+        window_ms=settings.READ_RECEIPT_WINDOW_MS,
     )
@@ -1,14 +1,89 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import time
+
+from sqlalchemy import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from app.core.config import settings
+from app.core.metrics import Histogram
 
 Base = declarative_base()
 
 
-def get_engine():
-    return create_async_engine(settings.DATABASE_URL, echo=False)
+class PoolMetrics:
+    """Connection pool usage shared by every pool created by get_engine"""
+
+    def __init__(self):
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = Histogram(name="db_pool_wait_seconds", help_="Time spent waiting for a pooled connection")
+        self.pool = None
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        return {
+            "size": pool.size() if pool is not None else 0,
+            "checked_out": pool.checkedout() if pool is not None else 0,
+            "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds.snapshot(),
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how many callers wait for a connection and for how long"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_metrics.pool = self
+
+    def _do_get(self):
+        pool_metrics.waiting += 1
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.waiting -= 1
+            pool_metrics.wait_seconds.observe(time.perf_counter() - started_at)
+        pool_metrics.checkouts += 1
+        return connection
+
+
+def get_engine(pooled: bool = True) -> AsyncEngine:
+    """Engine for DATABASE_URL, unpooled engines open a connection per checkout and close it on return"""
+    url = make_url(settings.DATABASE_URL)
+    kwargs = {}
+
+    if not pooled:
+        kwargs["poolclass"] = NullPool
+    elif url.get_backend_name() != "sqlite":
+        kwargs.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+
+    if url.get_driver_name() == "asyncpg":
+        # Both the asyncpg cache and the dialect's prepared statement cache, set to 0 behind pgbouncer
+        url = url.update_query_dict({"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)})
+        kwargs["connect_args"] = {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+
+    return create_async_engine(url, echo=False, **kwargs)
 
 
 def get_session_factory(engine):
@@ -19,7 +94,6 @@ def get_session_factory(engine):
     )
 
 
-async def create_tables():
-    engine = get_engine()
+async def create_tables(engine: AsyncEngine):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from passlib.context import CryptContext
+
+T = TypeVar("T")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when too many hashing operations are already queued"""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a dedicated thread pool.
+
+    bcrypt releases the GIL, so a small pool keeps the event loop responsive while hashing.
+    At most max_pending operations may be running or queued; beyond that callers get
+    PasswordHasherBusyError instead of piling up behind a login burst.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hasher")
+        self.pending = 0
+
+        self.operations = 0
+        self.rejected = 0
+        self.hash_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusyError("Too many password operations in progress")
+
+        self.pending += 1
+        submitted_at = time.perf_counter()
+
+        def timed():
+            started_at = time.perf_counter()
+            return started_at, func(*args), time.perf_counter() - started_at
+
+        try:
+            started_at, result, elapsed = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+        self.operations += 1
+        self.hash_seconds += elapsed
+        self.wait_seconds += started_at - submitted_at
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "operations": self.operations,
+            "rejected": self.rejected,
+            "hash_seconds_total": round(self.hash_seconds, 4),
+            "wait_seconds_total": round(self.wait_seconds, 4),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,157 @@
+import bisect
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from app.core.codec import codec
+
+UNREAD = '"is_read":false'
+
+
+class _ChatBuffer:
+    __slots__ = ("ids", "payloads", "size", "complete", "exhaustive")
+
+    def __init__(self):
+        # Parallel lists sorted by message ID, trimmed to the newest max_messages
+        self.ids: List[int] = []
+        self.payloads: List[str] = []
+        self.size = 0
+        # complete: seeded from the database, exhaustive: holds every message of the chat
+        self.complete = False
+        self.exhaustive = False
+
+
+class RecentMessageCache:
+    """
+    Ring buffers of the newest serialized ChatMessageOut payloads of each chat.
+
+    A buffer only exists while this worker is subscribed to the chat, since it is kept
+    up to date from the broadcast events. It is created empty when the subscription starts,
+    collects events from then on and becomes usable once seeded with the newest page from
+    the database. Read status events update is_read of the cached messages. Buffers are
+    evicted in LRU order when the payloads of all chats together exceed max_bytes.
+    """
+
+    def __init__(self, max_messages: int = 50, max_bytes: int = 32 * 1024 * 1024):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._chats: OrderedDict[int, _ChatBuffer] = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def track(self, chat_id: int):
+        """Start collecting events for a chat"""
+        if chat_id not in self._chats:
+            self._chats[chat_id] = _ChatBuffer()
+
+    def untrack(self, chat_id: int):
+        buffer = self._chats.pop(chat_id, None)
+        if buffer is not None:
+            self.size -= buffer.size
+
+    def is_tracked(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def append(self, chat_id: int, message_id: int, payload: str):
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            return
+        self._insert(buffer, message_id, payload)
+        self._trim(buffer)
+        self._enforce_budget()
+
+    def mark_read(self, chat_id: int, reader_id: int, message_id: int):
+        """Apply a read watermark: messages up to message_id not sent by reader_id become read"""
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            return
+        for index in range(bisect.bisect_right(buffer.ids, message_id)):
+            payload = buffer.payloads[index]
+            # Quotes inside the content are escaped, so this only matches the field itself
+            if UNREAD not in payload or codec.loads(payload)["sender_id"] == reader_id:
+                continue
+            read = payload.replace(UNREAD, '"is_read":true', 1)
+            buffer.payloads[index] = read
+            buffer.size += len(read) - len(payload)
+            self.size += len(read) - len(payload)
+
+    def seed_marker(self, chat_id: int) -> Optional[object]:
+        """
+        Taken before reading the page passed to fill, the page is ignored if the buffer
+        was reset meanwhile.
+        """
+        return self._chats.get(chat_id)
+
+    def fill(self, chat_id: int, entries: Iterable[Tuple[int, str]], marker: object, exhaustive: bool = False):
+        """
+        Seed a tracked buffer with the newest page from the database.
+
+        The page is merged with what the buffer holds, so a longer page read later still
+        extends a buffer that was seeded with a shorter one.
+        """
+        buffer = self._chats.get(chat_id)
+        if buffer is None or buffer is not marker:
+            return
+        for message_id, payload in entries:
+            self._insert(buffer, message_id, payload)
+        # A seeded buffer holding every message stays so, a merged page only adds older ones
+        buffer.exhaustive = exhaustive or (buffer.complete and buffer.exhaustive)
+        buffer.complete = True
+        self._trim(buffer)
+        self._enforce_budget()
+
+    def get(self, chat_id: int, limit: int) -> Optional[List[str]]:
+        """The newest limit payloads, oldest first, or None if the buffer cannot answer"""
+        buffer = self._chats.get(chat_id)
+        if (
+            buffer is None
+            or not buffer.complete
+            or limit > self.max_messages
+            or (len(buffer.ids) < limit and not buffer.exhaustive)
+        ):
+            self.misses += 1
+            return None
+        self._chats.move_to_end(chat_id)
+        self.hits += 1
+        return buffer.payloads[-limit:]
+
+    def _insert(self, buffer: _ChatBuffer, message_id: int, payload: str):
+        # Events almost always arrive in ID order, so this is an append
+        index = bisect.bisect_left(buffer.ids, message_id)
+        if index < len(buffer.ids) and buffer.ids[index] == message_id:
+            return
+        buffer.ids.insert(index, message_id)
+        buffer.payloads.insert(index, payload)
+        buffer.size += len(payload)
+        self.size += len(payload)
+
+    def _trim(self, buffer: _ChatBuffer):
+        excess = len(buffer.ids) - self.max_messages
+        if excess <= 0:
+            return
+        dropped = sum(len(payload) for payload in buffer.payloads[:excess])
+        del buffer.ids[:excess]
+        del buffer.payloads[:excess]
+        buffer.size -= dropped
+        self.size -= dropped
+        buffer.exhaustive = False
+
+    def _enforce_budget(self):
+        while self.size > self.max_bytes and self._chats:
+            _, buffer = self._chats.popitem(last=False)
+            self.size -= buffer.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self._chats),
+            "messages": sum(len(buffer.ids) for buffer in self._chats.values()),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from asyncio import CancelledError
+from collections import OrderedDict
+from typing import Awaitable, Callable, FrozenSet, Iterable, Optional, Tuple
+
+from broadcaster import Broadcast
+
+
+class MembershipCache:
+    """
+    Per-process cache of chat participants: chat_id -> frozenset of user IDs.
+
+    Entries are evicted in LRU order once max_size is reached and expire after ttl_seconds.
+    Invalidations are published on the broadcast channel so every worker drops its copy.
+    """
+
+    CHANNEL = "membership:invalidate"
+
+    def __init__(self, broadcast: Broadcast, max_size: int = 10_000, ttl_seconds: float = 60.0):
+        self.broadcast = broadcast
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[int, Tuple[float, FrozenSet[int]]] = OrderedDict()
+        # Bumped on every invalidation so loads that raced with one are not cached
+        self._epoch = 0
+        self._listener_task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, chat_id: int) -> Optional[FrozenSet[int]]:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, members = entry
+        if expires_at < time.monotonic():
+            del self._entries[chat_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(chat_id)
+        self.hits += 1
+        return members
+
+    def set(self, chat_id: int, members: Iterable[int], epoch: Optional[int] = None):
+        """Store the members of a chat, unless an invalidation happened since epoch was read"""
+        if epoch is not None and epoch != self._epoch:
+            return
+        self._entries[chat_id] = (time.monotonic() + self.ttl_seconds, frozenset(members))
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, chat_id: int, loader: Callable[[], Awaitable[Iterable[int]]]) -> FrozenSet[int]:
+        members = self.get(chat_id)
+        if members is not None:
+            return members
+        epoch = self._epoch
+        members = frozenset(await loader())
+        self.set(chat_id, members, epoch)
+        return members
+
+    def discard(self, chat_id: int):
+        self._epoch += 1
+        self.invalidations += 1
+        self._entries.pop(chat_id, None)
+
+    async def invalidate(self, chat_id: int):
+        """Drop the chat locally and on every other worker"""
+        self.discard(chat_id)
+        await self.broadcast.publish(channel=self.CHANNEL, message=str(chat_id))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    async def start(self):
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            self._listener_task = None
+
+    async def _listen(self):
+        try:
+            async with self.broadcast.subscribe(channel=self.CHANNEL) as subscriber:
+                async for event in subscriber:
+                    try:
+                        self.discard(int(event.message))
+                    except ValueError:
+                        continue
+        except CancelledError:
+            pass  # Ignore cancellation errors
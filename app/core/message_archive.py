@@ -0,0 +1,160 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import AsyncIterable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class ArchivedMessage(NamedTuple):
+    """Same fields as the history rows read from the database"""
+    id: int
+    sender_id: int
+    chat_id: int
+    text: str
+    timestamp: datetime
+    is_read: bool
+
+
+class _Partition(NamedTuple):
+    name: str
+    min_id: int
+    max_id: int
+    # chat_id -> (first message ID, last message ID)
+    chats: Dict[int, Tuple[int, int]]
+
+
+class MessageArchive:
+    """
+    Cold messages exported from detached partitions, readable through the history API.
+
+    Every partition becomes a directory with one gzipped JSON Lines file per chat, sorted by
+    message ID, and a manifest with the ID range of each chat. The manifests are kept in memory
+    and reloaded when the archive directory changes, so only the files of chats whose range
+    overlaps the requested page are read.
+    """
+
+    MANIFEST = "manifest.json"
+    WRITE_BATCH = 10_000
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._partitions: List[_Partition] = []
+        self._mtime: Optional[int] = None
+
+        self.reads = 0
+        self.exported = 0
+
+    async def export(self, name: str, rows: AsyncIterable[ArchivedMessage]):
+        """
+        Write a partition's messages, ordered by (chat_id, id), into the archive.
+
+        The files are written to a temporary directory that is renamed into place at the end,
+        so a partition is either fully archived or not at all.
+        """
+        target = os.path.join(self.directory, name)
+        staging = target + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        chats: Dict[int, Tuple[int, int]] = {}
+        current_chat, batch = None, []
+
+        async for row in rows:
+            if batch and (row.chat_id != current_chat or len(batch) >= self.WRITE_BATCH):
+                await asyncio.to_thread(self._write_chat, staging, current_chat, batch)
+                batch = []
+            current_chat = row.chat_id
+            batch.append(row)
+            first, _ = chats.get(row.chat_id, (row.id, row.id))
+            chats[row.chat_id] = (first, row.id)
+        if batch:
+            await asyncio.to_thread(self._write_chat, staging, current_chat, batch)
+
+        manifest = {
+            "min_id": min((first for first, _ in chats.values()), default=0),
+            "max_id": max((last for _, last in chats.values()), default=0),
+            "chats": {str(chat_id): [first, last] for chat_id, (first, last) in chats.items()},
+        }
+        with open(os.path.join(staging, self.MANIFEST), "w") as file:
+            json.dump(manifest, file)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.rename(staging, target)
+        self.exported += 1
+
+    async def get_history_rows(
+            self,
+            chat_id: int,
+            limit: int = 50,
+            before_id: int | None = None,
+            after_id: int | None = None,
+    ) -> List[ArchivedMessage]:
+        """Same page semantics as MessageRepository.get_history_rows, oldest first"""
+        self._refresh()
+        newest_first = after_id is None
+        partitions = sorted(self._partitions, key=lambda partition: partition.max_id, reverse=newest_first)
+
+        rows: List[ArchivedMessage] = []
+        for partition in partitions:
+            if len(rows) >= limit:
+                break
+            chat_range = partition.chats.get(chat_id)
+            if chat_range is None:
+                continue
+            first, last = chat_range
+            if (before_id is not None and first >= before_id) or (after_id is not None and last <= after_id):
+                continue
+
+            messages = await asyncio.to_thread(self._read_chat, partition.name, chat_id)
+            self.reads += 1
+            messages = [
+                message for message in messages
+                if (before_id is None or message.id < before_id) and (after_id is None or message.id > after_id)
+            ]
+            needed = limit - len(rows)
+            rows = messages[-needed:] + rows if newest_first else rows + messages[:needed]
+
+        return rows
+
+    def stats(self) -> dict:
+        return {"partitions": len(self._partitions), "reads": self.reads, "exported": self.exported}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            self._partitions = []
+            return
+        if mtime == self._mtime:
+            return
+        partitions = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name, self.MANIFEST)
+            if not os.path.isfile(path):
+                continue
+            with open(path) as file:
+                manifest = json.load(file)
+            chats = {int(chat_id): (first, last) for chat_id, (first, last) in manifest["chats"].items()}
+            partitions.append(_Partition(name, manifest["min_id"], manifest["max_id"], chats))
+        self._partitions = partitions
+        self._mtime = mtime
+
+    @staticmethod
+    def _write_chat(directory: str, chat_id: int, messages: List[ArchivedMessage]):
+        # Appending adds a gzip member, large chats are written in several batches
+        with gzip.open(os.path.join(directory, f"{chat_id}.jsonl.gz"), "at", encoding="utf-8") as file:
+            for message in messages:
+                record = message._asdict()
+                record["timestamp"] = message.timestamp.isoformat()
+                file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _read_chat(self, name: str, chat_id: int) -> List[ArchivedMessage]:
+        with gzip.open(os.path.join(self.directory, name, f"{chat_id}.jsonl.gz"), "rt", encoding="utf-8") as file:
+            messages = []
+            for line in file:
+                record = json.loads(line)
+                record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+                messages.append(ArchivedMessage(**record))
+            return messages
@@ -0,0 +1,97 @@
+from typing import List, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+class MessageStream:
+    """
+    Bounded per-chat Redis Stream of recently broadcast chat messages.
+
+    Every message is appended as the same JSON that goes over pub/sub, trimmed to roughly
+    max_len entries and expired with the chat's last activity. A reconnecting client sends
+    the last message ID it has seen and only the newer entries are replayed. When the stream
+    no longer reaches back that far, or Redis is unavailable, read_after returns None and the
+    caller falls back to the database.
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, redis_url: str = "", max_len: int = 1000, ttl_seconds: int = 86400, enabled: bool = False):
+        self.redis_url = redis_url
+        self.max_len = max_len
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled and bool(redis_url)
+        self._redis: Optional[Redis] = None
+
+        self.appended = 0
+        self.replays = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(chat_id: int) -> str:
+        return f"chat-stream:{chat_id}"
+
+    async def append(self, chat_id: int, message_id: int, payload: str):
+        """Append a serialized message, errors are logged and never reach the sender"""
+        if self._redis is None:
+            return
+        key = self.key(chat_id)
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.xadd(key, {"id": message_id, "payload": payload}, maxlen=self.max_len, approximate=True)
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+            self.appended += 1
+        except RedisError as e:
+            self.errors += 1
+            print(f"Error appending to message stream: {str(e)}")
+
+    async def read_after(self, chat_id: int, message_id: int) -> Optional[List[str]]:
+        """
+        Serialized messages newer than message_id, oldest first.
+
+        Returns None if the stream does not cover everything after message_id.
+        """
+        if self._redis is None:
+            return None
+        payloads = []
+        end = "+"
+        try:
+            while True:
+                entries = await self._redis.xrevrange(self.key(chat_id), max=end, min="-", count=self.PAGE_SIZE)
+                if not entries:
+                    # Trimmed, expired or never written
+                    self.fallbacks += 1
+                    return None
+                for entry_id, fields in entries:
+                    if int(fields["id"]) <= message_id:
+                        payloads.reverse()
+                        self.replays += 1
+                        return payloads
+                    payloads.append(fields["payload"])
+                end = f"({entries[-1][0]}"
+        except RedisError as e:
+            self.errors += 1
+            self.fallbacks += 1
+            print(f"Error reading message stream: {str(e)}")
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": int(self.enabled),
+            "appended": self.appended,
+            "replays": self.replays,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+        }
+
+    async def start(self):
+        if self.enabled and self._redis is None:
+            self._redis = Redis.from_url(self.redis_url, decode_responses=True)
+
+    async def stop(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
@@ -0,0 +1,209 @@
+import bisect
+import functools
+import time
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+from app.core.config import settings
+
+# Latency buckets in seconds, from 0.5 ms to 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# A callback returns either a single value or a mapping of label values to values
+CallbackResult = Union[float, Dict[str, float]]
+
+
+class Registry:
+    """
+    Process-wide collection of metrics rendered in the Prometheus text format.
+
+    Everything runs on the event loop thread, so metrics are plain attribute increments
+    without locks. When disabled, updates are dropped and nothing is rendered.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List = []
+        self._callbacks: List[Tuple[str, str, str, str, Callable[[], CallbackResult]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name: str, help_: str, func: Callable[[], CallbackResult], label: str = "name", type_: str = "gauge"):
+        """Register a value that is read only when metrics are rendered"""
+        self._callbacks.append((name, help_, type_, label, func))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_, type_, label, func in self._callbacks:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {type_}")
+            value = func()
+            if isinstance(value, dict):
+                for label_value, item in value.items():
+                    lines.append(f'{name}{{{label}="{label_value}"}} {_format(item)}')
+            else:
+                lines.append(f"{name} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry(enabled=settings.METRICS_ENABLED)
+
+
+class Counter:
+    def __init__(self, name: str, help_: str, registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help_
+        self.registry = registry
+        self.value = 0
+        registry.register(self)
+
+    def inc(self, amount: int = 1):
+        if self.registry.enabled:
+            self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram.
+
+    Observations are plain integer increments, so it can be used on hot paths.
+    Created with a name it is registered and rendered, without one it is a standalone helper.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, name: str | None = None, help_: str = "",
+                 registry: Registry = REGISTRY, labels: str = ""):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.name = name
+        self.help = help_
+        self.registry = registry
+        self.labels = labels
+        if name is not None and not labels:
+            registry.register(self)
+
+    def observe(self, value: float):
+        if not self.registry.enabled:
+            return
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def time(self):
+        """Context manager observing the duration of the block"""
+        return _Timer(self)
+
+    def cumulative(self) -> List[tuple]:
+        """(upper bound, cumulative count) pairs, the last bound is +Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): count for bound, count in self.cumulative()},
+        }
+
+    def render(self, header: bool = True) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"] if header else []
+        prefix = f"{self.labels}," if self.labels else ""
+        suffix = f"{{{self.labels}}}" if self.labels else ""
+        for bound, count in self.cumulative():
+            lines.append(f'{self.name}_bucket{{{prefix}le="{_format(bound)}"}} {count}')
+        lines.append(f"{self.name}_sum{suffix} {self.sum}")
+        lines.append(f"{self.name}_count{suffix} {self.count}")
+        return lines
+
+
+class HistogramVec:
+    """Histograms of one metric split by a single label"""
+
+    def __init__(self, name: str, help_: str, label: str, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help_
+        self.label = label
+        self.buckets = buckets
+        self.registry = registry
+        self.children: Dict[str, Histogram] = {}
+        registry.register(self)
+
+    def labels(self, value: str) -> Histogram:
+        child = self.children.get(value)
+        if child is None:
+            child = Histogram(self.buckets, name=self.name, registry=self.registry, labels=f'{self.label}="{value}"')
+            self.children[value] = child
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for child in self.children.values():
+            lines.extend(child.render(header=False))
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "started_at")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started_at)
+
+
+def timed(histogram_vec: HistogramVec):
+    """Decorator observing the latency of an async method, labelled with its qualified name"""
+    def decorator(func):
+        histogram = histogram_vec.labels(func.__qualname__)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return await func(*args, **kwargs)
+            started_at = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started_at)
+        return wrapper
+    return decorator
+
+
+# Hot path metrics shared across modules
+ws_messages_in = Counter("ws_messages_in_total", "Frames received from WebSocket clients")
+ws_messages_out = Counter("ws_messages_out_total", "Frames sent to WebSocket clients")
+ws_delivery_seconds = Histogram(
+    name="ws_delivery_seconds", help_="Time from receiving a broadcast event to sending it to a socket",
+)
+broadcast_publish_seconds = Histogram(
+    name="broadcast_publish_seconds", help_="Latency of publishing an event to the broadcast backend",
+)
+serialization_seconds = HistogramVec(
+    "serialization_seconds", "Time spent serializing outbound payloads", label="kind",
+)
+repository_query_seconds = HistogramVec(
+    "repository_query_seconds", "Latency of repository methods", label="method",
+)
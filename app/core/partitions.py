@@ -0,0 +1,228 @@
+import asyncio
+import re
+from asyncio import CancelledError
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.message_archive import ArchivedMessage, MessageArchive
+
+PARTITION_INTERVALS = ("day", "week", "month")
+PARTITION_PREFIX = "messages_p"
+
+# Messages stored around the same instant may get IDs and timestamps in a different order,
+# history pages near a partition boundary also look at the older partition
+PARTITION_BOUNDARY_SLACK = timedelta(minutes=1)
+
+# History pages query this many partitions one by one, then all older ones at once
+PARTITION_SCAN_WINDOWS = 3
+
+_BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_start(moment: datetime, interval: str) -> datetime:
+    """Start of the partition containing moment"""
+    day = datetime(moment.year, moment.month, moment.day)
+    if interval == "day":
+        return day
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown partition interval {interval!r}, expected one of {', '.join(PARTITION_INTERVALS)}")
+
+
+def next_partition_start(start: datetime, interval: str) -> datetime:
+    if interval == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=7 if interval == "week" else 1)
+
+
+def previous_partition_start(start: datetime, interval: str) -> datetime:
+    return partition_start(start - timedelta(days=1), interval)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+class MessagePartitionManager:
+    """
+    Range partitions of the messages table by timestamp (PostgreSQL only).
+
+    Keeps the current partition and `ahead` future ones created, and detaches partitions
+    that ended more than `retained` intervals before the current one. Detached partitions
+    are exported to the archive and dropped, without an archive they are kept as plain tables.
+    Indexes are defined on the parent table, so every new partition gets them.
+
+    Maintenance runs on start and every check_seconds on every worker, an advisory lock
+    makes sure only one worker changes partitions at a time. Each worker keeps the bounds of
+    the attached partitions, newest first, so history queries can target single partitions.
+    """
+
+    LOCK_ID = 0x6D736770  # "msgp"
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            interval: str = "",
+            ahead: int = 2,
+            retained: int = 0,
+            archive: Optional[MessageArchive] = None,
+            check_seconds: float = 3600,
+    ):
+        if interval:
+            partition_start(datetime.now(), interval)  # validate early
+        self.engine = engine
+        self.interval = interval
+        self.ahead = ahead
+        self.retained = retained
+        self.archive = archive
+        self.check_seconds = check_seconds
+        self.enabled = bool(interval) and engine.dialect.name == "postgresql"
+
+        self._windows: List[Tuple[datetime, datetime]] = []
+        # Database clock minus local clock, partitions are in database time
+        self._clock_offset = timedelta()
+        self._task: Optional[asyncio.Task] = None
+
+        self.created = 0
+        self.detached = 0
+        self.archived = 0
+        self.errors = 0
+
+    def windows(self) -> List[Tuple[datetime, datetime]]:
+        """(start, end) of the attached partitions that have started, newest first"""
+        now = datetime.now() + self._clock_offset + PARTITION_BOUNDARY_SLACK
+        return [window for window in self._windows if window[0] <= now]
+
+    def stats(self) -> dict:
+        return {
+            "attached": len(self._windows),
+            "created": self.created,
+            "detached": self.detached,
+            "archived": self.archived,
+            "errors": self.errors,
+        }
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        await self.run_maintenance()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_seconds)
+            await self.run_maintenance()
+
+    async def run_maintenance(self):
+        """Create upcoming partitions, retire expired ones and reload the partition bounds"""
+        try:
+            async with self.engine.connect() as conn:
+                if not await self._is_partitioned(conn):
+                    print("Messages table is not partitioned, recreate it to enable MESSAGE_PARTITION_INTERVAL")
+                    self.enabled = False
+                    return
+
+                db_now = (await conn.execute(text("SELECT localtimestamp"))).scalar()
+                self._clock_offset = db_now - datetime.now()
+
+                locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": self.LOCK_ID})).scalar()
+                await conn.commit()
+                if locked:
+                    try:
+                        await self._create_ahead(conn, db_now)
+                        await self._detach_expired(conn, db_now)
+                        if self.archive is not None:
+                            await self._archive_detached(conn)
+                    finally:
+                        await conn.rollback()
+                        await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": self.LOCK_ID})
+                        await conn.commit()
+
+                self._windows = await self._attached_windows(conn)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error maintaining message partitions: {str(e)}")
+
+    async def _is_partitioned(self, conn: AsyncConnection) -> bool:
+        result = await conn.execute(text("SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass"))
+        return result.scalar() == "p"
+
+    async def _create_ahead(self, conn: AsyncConnection, now: datetime):
+        existing = {name for _, _, name in await self._attached_partitions(conn)}
+        start = partition_start(now, self.interval)
+        for _ in range(self.ahead + 1):
+            end = next_partition_start(start, self.interval)
+            name = partition_name(start)
+            if name not in existing:
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+                await conn.commit()
+                self.created += 1
+            start = end
+
+    async def _detach_expired(self, conn: AsyncConnection, now: datetime):
+        if not self.retained:
+            return
+        cutoff = partition_start(now, self.interval)
+        for _ in range(self.retained):
+            cutoff = previous_partition_start(cutoff, self.interval)
+        for start, end, name in await self._attached_partitions(conn):
+            if end <= cutoff:
+                await conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+                await conn.commit()
+                self.detached += 1
+
+    async def _archive_detached(self, conn: AsyncConnection):
+        """Export and drop detached partitions, also the ones left over by an interrupted run"""
+        result = await conn.execute(
+            text(
+                "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+                "AND relname LIKE :pattern ORDER BY relname"
+            ),
+            {"pattern": PARTITION_PREFIX.replace("_", r"\_") + "%"},
+        )
+        names = result.scalars().all()
+        await conn.commit()
+
+        for name in names:
+            rows = await conn.stream(text(
+                f"SELECT id, sender_id, chat_id, text, timestamp, is_read FROM {name} ORDER BY chat_id, id"
+            ))
+            await self.archive.export(name, (ArchivedMessage(*row) async for row in rows))
+            await conn.execute(text(f"DROP TABLE {name}"))
+            await conn.commit()
+            self.archived += 1
+
+    async def _attached_partitions(self, conn: AsyncConnection) -> List[Tuple[datetime, datetime, str]]:
+        result = await conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'messages'::regclass"
+        ))
+        partitions = []
+        for name, bound in result.all():
+            match = _BOUNDS.search(bound or "")
+            if match is None:  # DEFAULT partition
+                continue
+            partitions.append((datetime.fromisoformat(match[1]), datetime.fromisoformat(match[2]), name))
+        await conn.commit()
+        return sorted(partitions, reverse=True)
+
+    async def _attached_windows(self, conn: AsyncConnection) -> List[Tuple[datetime, datetime]]:
+        return [(start, end) for start, end, _ in await self._attached_partitions(conn)]
@@ -0,0 +1,69 @@
+from enum import Enum
+from typing import List
+
+from broadcaster import Broadcast
+from sqlalchemy.engine import make_url
+
+
+class PubSubBackend(str, Enum):
+    """Where broadcast events go between workers"""
+    MEMORY = "memory"  # in-process only, for a single worker and local runs without Redis
+    REDIS = "redis"
+    POSTGRES = "postgres"  # LISTEN/NOTIFY on the app database, payloads are limited to 8000 bytes
+
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+POSTGRES_MAX_PAYLOAD_BYTES = 7999
+
+
+class EventTooLargeError(ValueError):
+    """An event does not fit into a single message of the broadcast backend"""
+
+
+def get_max_payload_bytes(backend: PubSubBackend) -> int:
+    """Largest event payload the backend can carry in bytes, 0 if there is no practical limit"""
+    return POSTGRES_MAX_PAYLOAD_BYTES if PubSubBackend(backend) == PubSubBackend.POSTGRES else 0
+
+
+def get_broadcast_url(backend: PubSubBackend, redis_url: str = "", database_url: str = "") -> str:
+    """
+    Build the broadcaster URL for the configured backend.
+
+    Raises:
+        ValueError: If the backend is unknown or its connection URL is not set
+    """
+    backend = PubSubBackend(backend)
+    if backend == PubSubBackend.MEMORY:
+        return "memory://"
+    if backend == PubSubBackend.REDIS:
+        if not redis_url:
+            raise ValueError("REDIS_URL must be set for the redis broadcast backend")
+        return redis_url
+    if not database_url:
+        raise ValueError("DATABASE_URL must be set for the postgres broadcast backend")
+    # asyncpg wants a plain postgresql:// DSN without the SQLAlchemy driver suffix
+    return make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class BroadcastPool:
+    """
+    A fixed set of broadcast connections used for chat traffic.
+
+    The primary broadcaster is shared with the rest of the app and is connected by the app
+    itself, the remaining members are extra connections owned by the pool. Keys are mapped to
+    members by modulo, so a shard always publishes and subscribes through the same connection.
+    """
+
+    def __init__(self, primary: Broadcast, url: str, size: int = 1):
+        self.members: List[Broadcast] = [primary] + [Broadcast(url=url) for _ in range(max(size, 1) - 1)]
+
+    def get(self, key: int) -> Broadcast:
+        return self.members[key % len(self.members)]
+
+    async def connect(self):
+        for member in self.members[1:]:
+            await member.connect()
+
+    async def disconnect(self):
+        for member in self.members[1:]:
+            await member.disconnect()
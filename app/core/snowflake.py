@@ -0,0 +1,190 @@
+import asyncio
+import time
+from asyncio import CancelledError
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+# Names PostgreSQL accepts for UTC, timestamps of generated IDs are UTC
+UTC_TIMEZONES = {
+    "utc", "etc/utc", "uct", "etc/uct", "gmt", "etc/gmt", "gmt0", "etc/gmt0", "etc/gmt+0", "etc/gmt-0",
+    "greenwich", "etc/greenwich", "universal", "etc/universal", "zulu", "etc/zulu",
+}
+
+
+class WorkerIdLostError(RuntimeError):
+    """The advisory lock on the worker ID was lost, IDs cannot be generated until it is claimed again"""
+
+
+class SnowflakeGenerator:
+    """
+    Time-ordered message IDs generated in-process: milliseconds since EPOCH, worker ID, sequence.
+
+    The layout is 41 + 6 + 6 bits, so IDs fit in a BIGINT and stay below 2**53, where
+    JavaScript clients can still represent them exactly. IDs of one worker are strictly
+    increasing: when the clock goes back or 64 IDs were handed out within a millisecond,
+    the generator moves on to the next millisecond instead of waiting. IDs of different
+    workers are ordered by time to the millisecond.
+
+    With worker_id set to -1 the worker ID is claimed at start with a PostgreSQL advisory
+    lock, held on a connection of its own engine (not pooled) until stop. The lock is checked
+    every lock_check_seconds, once it is lost no IDs are generated until a free worker ID is
+    claimed again. Other databases use worker 0.
+
+    Timestamps are derived from the IDs in UTC, so on PostgreSQL the database time zone
+    has to be UTC for them to match now() and the partition bounds.
+    """
+
+    WORKER_BITS = 6
+    SEQUENCE_BITS = 6
+    MAX_WORKERS = 1 << WORKER_BITS
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+    EPOCH = datetime(2024, 1, 1)
+    EPOCH_MS = int((EPOCH - datetime(1970, 1, 1)).total_seconds() * 1000)
+    LOCK_NAMESPACE = 0x736E6F77  # "snow"
+
+    def __init__(self, engine: AsyncEngine, worker_id: int = -1, enabled: bool = False, lock_check_seconds: float = 5):
+        if worker_id >= self.MAX_WORKERS:
+            raise ValueError(f"Snowflake worker ID must be below {self.MAX_WORKERS}")
+        self.engine = engine
+        self.worker_id = worker_id
+        self.enabled = enabled
+        self.lock_check_seconds = lock_check_seconds
+
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock_connection: Optional[AsyncConnection] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._lost = False
+
+        self.generated = 0
+        self.borrowed_ms = 0
+        self.locks_lost = 0
+
+    def next_id(self) -> int:
+        """
+        Raises:
+            WorkerIdLostError: If the worker ID lock was lost and not claimed again yet
+        """
+        if self._lost:
+            raise WorkerIdLostError("Snowflake worker ID lock was lost")
+        now = time.time_ns() // 1_000_000 - self.EPOCH_MS
+        if now > self._last_ms:
+            self._last_ms, self._sequence = now, 0
+        elif self._sequence < self.MAX_SEQUENCE:
+            self._sequence += 1
+        else:
+            self._last_ms += 1
+            self._sequence = 0
+            self.borrowed_ms += 1
+        self.generated += 1
+        return (self._last_ms << (self.WORKER_BITS + self.SEQUENCE_BITS)) | (self.worker_id << self.SEQUENCE_BITS) | self._sequence
+
+    @classmethod
+    def timestamp_of(cls, message_id: int) -> datetime:
+        """UTC time encoded in an ID, naive like the timestamps stored in the database"""
+        return cls.EPOCH + timedelta(milliseconds=message_id >> (cls.WORKER_BITS + cls.SEQUENCE_BITS))
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "generated": self.generated,
+            "borrowed_ms": self.borrowed_ms,
+            "locks_lost": self.locks_lost,
+            "lost": int(self._lost),
+        }
+
+    async def start(self):
+        if not self.enabled:
+            return
+        if self.engine.dialect.name != "postgresql":
+            if self.worker_id < 0:
+                self.worker_id = 0
+            return
+
+        async with self.engine.connect() as conn:
+            timezone = (await conn.execute(text("SELECT current_setting('TimeZone')"))).scalar()
+        if timezone.lower() not in UTC_TIMEZONES:
+            raise RuntimeError(
+                f"MESSAGE_ID_GENERATOR=snowflake needs the database time zone to be UTC, it is {timezone}"
+            )
+
+        if self.worker_id < 0:
+            await self._claim()
+            self._watch_task = asyncio.create_task(self._watch_lock())
+
+    async def stop(self):
+        """Release the claimed worker ID"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except CancelledError:
+                pass
+            self._watch_task = None
+        if self._lock_connection is not None:
+            await self._lock_connection.execute(
+                text("SELECT pg_advisory_unlock(:namespace, :worker_id)"),
+                {"namespace": self.LOCK_NAMESPACE, "worker_id": self.worker_id},
+            )
+            await self._lock_connection.close()
+            self._lock_connection = None
+        await self.engine.dispose()
+
+    async def _claim(self):
+        connection = await self.engine.connect()
+        try:
+            for candidate in range(self.MAX_WORKERS):
+                result = await connection.execute(
+                    text("SELECT pg_try_advisory_lock(:namespace, :worker_id)"),
+                    {"namespace": self.LOCK_NAMESPACE, "worker_id": candidate},
+                )
+                await connection.commit()
+                if result.scalar():
+                    self.worker_id = candidate
+                    self._lock_connection = connection
+                    self._lost = False
+                    return
+        except BaseException:
+            await connection.close()
+            raise
+        await connection.close()
+        raise RuntimeError(f"All {self.MAX_WORKERS} snowflake worker IDs are taken")
+
+    async def _lock_held(self) -> bool:
+        try:
+            result = await self._lock_connection.execute(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted "
+                    "AND pid = pg_backend_pid() AND classid = :namespace AND objid = :worker_id AND objsubid = 2)"
+                ),
+                {"namespace": self.LOCK_NAMESPACE, "worker_id": self.worker_id},
+            )
+            await self._lock_connection.commit()
+            return bool(result.scalar())
+        except Exception as e:
+            print(f"Error checking the snowflake worker ID lock: {str(e)}")
+            return False
+
+    async def _watch_lock(self):
+        """Stop generating IDs once the lock is gone, e.g. with its connection, and claim a free ID again"""
+        while True:
+            await asyncio.sleep(self.lock_check_seconds)
+            if not self._lost and await self._lock_held():
+                continue
+            if not self._lost:
+                self._lost = True
+                self.locks_lost += 1
+                print(f"Snowflake worker ID {self.worker_id} lock lost, not generating IDs until one is claimed")
+            if self._lock_connection is not None:
+                try:
+                    await self._lock_connection.close()
+                except Exception:
+                    pass
+                self._lock_connection = None
+            try:
+                await self._claim()
+            except Exception as e:
+                print(f"Error claiming a snowflake worker ID: {str(e)}")
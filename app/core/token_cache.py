@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import json
+import time
+from asyncio import CancelledError
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from broadcaster import Broadcast
+from jose import JWTError, jwt
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+
+
+class TokenCache:
+    """
+    Bounded cache of verified JWT claims keyed by the token hash.
+
+    Entries live until the token's exp and are evicted in LRU order once max_size is reached.
+    Revoked tokens are pushed to every worker over the broadcast channel and kept in memory
+    until they expire. With a Redis URL they are also stored in a sorted set scored by exp,
+    which a worker loads on start, so it knows about revocations made before it started.
+    When trust_claims is set, callers may skip the user lookup entirely.
+    """
+
+    CHANNEL = "auth:revoke"
+    REVOKED_KEY = "auth:revoked"
+
+    def __init__(self, broadcast: Broadcast, max_size: int = 50_000, trust_claims: bool = False, redis_url: str = ""):
+        self.broadcast = broadcast
+        self.max_size = max_size
+        self.trust_claims = trust_claims
+        self.redis_url = redis_url
+        self._entries: OrderedDict[str, Tuple[float, dict]] = OrderedDict()
+        # token hash -> exp
+        self._revoked_tokens: Dict[str, float] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        self._redis: Optional[Redis] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def decode(self, token: str) -> dict:
+        """
+        Return the verified claims of a token.
+
+        Raises:
+            JWTError: If the token is invalid, expired or revoked
+        """
+        key = self.token_key(token)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            claims = entry[1]
+        else:
+            self.misses += 1
+            claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            exp = claims.get("exp")
+            if exp is not None:
+                self._entries[key] = (float(exp), claims)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        if self._is_revoked(key):
+            raise JWTError("Token has been revoked")
+        return claims
+
+    def _is_revoked(self, key: str) -> bool:
+        exp = self._revoked_tokens.get(key)
+        return exp is not None and exp > time.time()
+
+    async def revoke_token(self, token: str, exp: float):
+        """Revoke a single token on every worker"""
+        key = self.token_key(token)
+        if self._redis is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.zadd(self.REVOKED_KEY, {key: exp})
+                    pipe.zremrangebyscore(self.REVOKED_KEY, "-inf", time.time())
+                    pipe.expire(self.REVOKED_KEY, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+                    await pipe.execute()
+            except RedisError as e:
+                print(f"Error storing token revocation: {str(e)}")
+        await self.broadcast.publish(channel=self.CHANNEL, message=json.dumps({"token": key, "exp": exp}))
+        self._apply({"token": key, "exp": exp})
+
+    def _apply(self, message: dict):
+        self._revoked_tokens[message["token"]] = float(message["exp"])
+        self._entries.pop(message["token"], None)
+
+        # Forget revocations once the tokens have expired
+        now = time.time()
+        self._revoked_tokens = {k: exp for k, exp in self._revoked_tokens.items() if exp > now}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "revoked_tokens": len(self._revoked_tokens),
+        }
+
+    async def start(self):
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+        if self.redis_url and self._redis is None:
+            self._redis = Redis.from_url(self.redis_url, decode_responses=True)
+            await self._load_revoked()
+
+    async def stop(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            self._listener_task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _load_revoked(self):
+        """Load the revocations stored before this worker started"""
+        try:
+            await self._redis.zremrangebyscore(self.REVOKED_KEY, "-inf", time.time())
+            revoked = await self._redis.zrange(self.REVOKED_KEY, 0, -1, withscores=True)
+        except RedisError as e:
+            print(f"Error loading token revocations: {str(e)}")
+            return
+        for key, exp in revoked:
+            self._apply({"token": key, "exp": exp})
+
+    async def _listen(self):
+        try:
+            async with self.broadcast.subscribe(channel=self.CHANNEL) as subscriber:
+                async for event in subscriber:
+                    try:
+                        self._apply(json.loads(event.message))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except CancelledError:
+            pass  # Ignore cancellation errors
@@ -1,13 +1,15 @@
 from fastapi import WebSocket, status
-from jose import JWTError, jwt
+from jose import JWTError
 
-from app.core.config import settings
+from app.core.auth import user_from_claims
+from app.core.token_cache import TokenCache
 from app.repositories.user_repository import UserRepository
 
 
 async def get_user_from_token(
         websocket: WebSocket,
-        user_repository: UserRepository
+        user_repository: UserRepository,
+        token_cache: TokenCache,
 ):
     """
     Get the user from the token in the WebSocket connection.
@@ -25,15 +27,21 @@ async def get_user_from_token(
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid authentication scheme")
             return None
 
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = token_cache.decode(token)
         user_id: str = payload.get("sub")
 
         if user_id is None:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid authentication token")
             return None
 
-        # Get user with relationships loaded for WebSocket context
-        user = await user_repository.get_by_id(int(user_id), load_relationships=True)
+        # Stateless fast path: trust the verified claims without a DB round trip
+        if token_cache.trust_claims:
+            user = user_from_claims(payload)
+            if user is not None:
+                return user
+
+        # Only the user row is needed, the relationships are never used by the socket
+        user = await user_repository.get_by_id(int(user_id))
         if user is None:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="User not found")
             return None
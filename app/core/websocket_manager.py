@@ -1,71 +1,475 @@
 import asyncio
 from asyncio import CancelledError
 from datetime import datetime, UTC
-from typing import Dict
+from typing import Dict, Hashable, List, Optional, Sequence, Set
 
 from broadcaster import Broadcast
 from fastapi import WebSocket
-from pydantic import BaseModel
-from starlette.websockets import WebSocketDisconnect, WebSocketState
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Row
+from starlette.websockets import WebSocketState
 
-from app.schemas.websocket_messages import ChatMessageOut, ReadStatusOut
+from app.core.client_connection import ClientConnection, SlowConsumerPolicy
+from app.core.codec import Subprotocol, codec, json_to_msgpack, negotiate_subprotocol
+from app.core.history_cache import RecentMessageCache
+from app.core.message_stream import MessageStream
+from app.core.metrics import broadcast_publish_seconds, serialization_seconds
+from app.core.pubsub import BroadcastPool, EventTooLargeError
+from app.schemas.websocket_messages import ChatMessageOut, ErrorOut, MessageType, ReadStatusOut
+
+READ_STATUS_PREFIX = '{"type":"read_status"'
+MESSAGE_PREFIX = '{"type":"message","id":'
+
+# Stand-ins for the ID and timestamp of a message that has not been stored yet, the longest possible
+MAX_MESSAGE_ID = 2 ** 63 - 1
+MAX_TIMESTAMP = datetime.max
+
+chat_messages_adapter = TypeAdapter(List[ChatMessageOut])
+
+broadcast_serialization_seconds = serialization_seconds.labels("broadcast")
+history_serialization_seconds = serialization_seconds.labels("history")
+msgpack_serialization_seconds = serialization_seconds.labels("msgpack")
+
+
+def encode_history(chat_id: int, rows: Sequence[Row], chunk_size: int = 0) -> List[str]:
+    """
+    Serialize (id, sender_id, text, timestamp, is_read) rows of a chat into history frames.
+
+    All rows go into one frame unless chunk_size is set.
+    """
+    with history_serialization_seconds.time():
+        messages = [message_from_row(chat_id, row) for row in rows]
+        chunk_size = chunk_size or len(messages) or 1
+        return [
+            history_frame(chat_id, chat_messages_adapter.dump_json(messages[start:start + chunk_size]).decode())
+            for start in range(0, max(len(messages), 1), chunk_size)
+        ]
+
+
+def message_from_row(chat_id: int, row: Row) -> ChatMessageOut:
+    return ChatMessageOut.model_construct(
+        id=row.id,
+        sender_id=row.sender_id,
+        content=row.text,
+        timestamp=row.timestamp,
+        is_read=row.is_read,
+        chat_id=chat_id,
+    )
+
+
+def history_frame(chat_id: int, messages_json: str) -> str:
+    """Wrap an already-serialized JSON array of messages into a history frame"""
+    return f'{{"type":"{MessageType.HISTORY.value}","chat_id":{chat_id},"messages":{messages_json}}}'
 
 
 class ConnectionManager:
-    def __init__(self, broadcast: Broadcast):
-        self.listing_tasks: Dict[WebSocket, asyncio.Task] = {}
+    """
+    Local fan-out hub for chat WebSockets.
+
+    Each process keeps a single broadcast subscription per channel and a registry of
+    the sockets connected to each chat locally. Events received from the channel
+    are already JSON-serialized, so the same payload is queued for every local socket.
+    A multiplexed socket is subscribed to several chats, every event carries its chat_id.
+
+    With shard_count set, chats are hashed into that many shard channels and every event
+    is prefixed with its chat ID, so a worker serving many chats keeps at most shard_count
+    subscriptions and demultiplexes events to chats locally. Shards are spread over the
+    connections of the broadcast pool.
+
+    Chat messages are also appended to the message stream, if one is given, so reconnecting
+    clients can be sent only what they missed, and recorded in the history cache for chats
+    with local sockets.
+
+    With max_payload_bytes set, larger events are rejected with EventTooLargeError before
+    they are published, since the backend would fail or drop them.
+    """
+
+    RESUBSCRIBE_DELAY = 0.5
+    RESUBSCRIBE_MAX_DELAY = 30.0
+
+    def __init__(
+            self,
+            broadcast: Broadcast,
+            send_queue_size: int = 256,
+            slow_consumer_policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+            coalesce_read_status: bool = True,
+            max_backlog_ms: int = 0,
+            broadcast_pool: Optional[BroadcastPool] = None,
+            shard_count: int = 0,
+            message_stream: Optional[MessageStream] = None,
+            history_cache: Optional[RecentMessageCache] = None,
+            max_payload_bytes: int = 0,
+    ):
         self.broadcast = broadcast
-        self.chat_locks: Dict[int, asyncio.Lock] = {}
+        self.message_stream = message_stream
+        self.history_cache = history_cache
+        self.broadcast_pool = broadcast_pool
+        self.shard_count = shard_count
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.coalesce_read_status = coalesce_read_status
+        self.max_backlog_ms = max_backlog_ms
+        self.max_payload_bytes = max_payload_bytes
+
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.chat_connections: Dict[int, Set[ClientConnection]] = {}
+        # Channel name -> local chats routed through it, and its listener task
+        self.channel_chats: Dict[str, Set[int]] = {}
+        self.listing_tasks: Dict[str, asyncio.Task] = {}
+        self.channel_ready: Dict[str, asyncio.Event] = {}
+
+    async def connect(self, websocket: WebSocket, chat_id: Optional[int] = None):
+        """Accept a socket and, unless it is multiplexed, subscribe it to its chat"""
+        subprotocol = negotiate_subprotocol(websocket)
+        await websocket.accept(subprotocol=subprotocol.value if subprotocol else None)
+        connection = ClientConnection(
+            websocket,
+            max_queue_size=self.send_queue_size,
+            policy=self.slow_consumer_policy,
+            coalesce_read_status=self.coalesce_read_status,
+            max_backlog_ms=self.max_backlog_ms,
+            on_close=self._unregister,
+            binary=subprotocol == Subprotocol.MSGPACK,
+        )
+        self.connections[websocket] = connection
+        if chat_id is not None:
+            await self.subscribe(websocket, [chat_id])
+
+    async def subscribe(self, websocket: WebSocket, chat_ids: Sequence[int]):
+        """Start delivering the chats' events to a connected socket"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        for chat_id in chat_ids:
+            self._add_to_chat(connection, chat_id)
+        for chat_id in chat_ids:
+            await self._wait_subscribed(chat_id)
 
-    async def connect(self, websocket: WebSocket, chat_id: int):
-        await websocket.accept()
-        self.listing_tasks[websocket] = asyncio.create_task(self.listen_for_messages(websocket, chat_id))
+    def unsubscribe(self, websocket: WebSocket, chat_id: int):
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._remove_from_chat(connection, chat_id)
+
+    def _add_to_chat(self, connection: ClientConnection, chat_id: int):
+        connection.chat_ids.add(chat_id)
+        connections = self.chat_connections.setdefault(chat_id, set())
+        connections.add(connection)
+        if len(connections) > 1:
+            return
+        if self.history_cache is not None:
+            self.history_cache.track(chat_id)
+        channel_name = self.channel_for(chat_id)
+        chats = self.channel_chats.setdefault(channel_name, set())
+        chats.add(chat_id)
+        task = self.listing_tasks.get(channel_name)
+        if task is None or task.done():
+            self.channel_ready[channel_name] = asyncio.Event()
+            self.listing_tasks[channel_name] = asyncio.create_task(self.listen_for_messages(chat_id))
+
+    async def _wait_subscribed(self, chat_id: int):
+        """Wait until the chat's channel is subscribed, so no event published from now on is missed"""
+        channel_name = self.channel_for(chat_id)
+        ready = self.channel_ready.get(channel_name)
+        task = self.listing_tasks.get(channel_name)
+        if ready is None or task is None or ready.is_set():
+            return
+        waiter = asyncio.create_task(ready.wait())
+        await asyncio.wait({waiter, task}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
 
     async def disconnect(self, websocket: WebSocket):
-        if websocket in self.listing_tasks:
-            task = self.listing_tasks[websocket]
-            if not task.done():
-                task.cancel()
-            del self.listing_tasks[websocket]
-        if websocket.client_state != WebSocketState.DISCONNECTED:
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.abort()
+        if WebSocketState.DISCONNECTED in (websocket.client_state, websocket.application_state):
+            return
+        try:
             await websocket.close()
+        except RuntimeError:
+            pass  # Already being closed by the connection's writer
+
+    def _unregister(self, connection: ClientConnection):
+        self.connections.pop(connection.websocket, None)
+        for chat_id in list(connection.chat_ids):
+            self._remove_from_chat(connection, chat_id)
+
+    def _remove_from_chat(self, connection: ClientConnection, chat_id: int):
+        connection.chat_ids.discard(chat_id)
+        connections = self.chat_connections.get(chat_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if connections:
+            return
+        del self.chat_connections[chat_id]
+        if self.history_cache is not None:
+            self.history_cache.untrack(chat_id)
+        channel_name = self.channel_for(chat_id)
+        chats = self.channel_chats.get(channel_name)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self.channel_chats[channel_name]
+                self._stop_listening(channel_name)
+
+    def _stop_listening(self, channel_name: str):
+        self.channel_ready.pop(channel_name, None)
+        task = self.listing_tasks.pop(channel_name, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def channel_for(self, chat_id: int) -> str:
+        if self.shard_count:
+            return f"chat-shard:{chat_id % self.shard_count}"
+        return f"chat:{chat_id}"
+
+    def _broadcast_for(self, chat_id: int) -> Broadcast:
+        if self.broadcast_pool is None:
+            return self.broadcast
+        return self.broadcast_pool.get(chat_id % self.shard_count if self.shard_count else chat_id)
+
+    def subscription_count(self) -> int:
+        """Number of broadcast channels this process is subscribed to"""
+        return len(self.listing_tasks)
+
+    def local_socket_count(self, chat_id: int | None = None) -> int:
+        """Number of sockets connected to this process, optionally for one chat"""
+        if chat_id is None:
+            return len(self.connections)
+        return len(self.chat_connections.get(chat_id, ()))
+
+    def get_connection(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        return self.connections.get(websocket)
+
+    def send_history(self, websocket: WebSocket, chat_id: int, rows: Sequence[Row], chunk_size: int = 0):
+        """Queue chat history for a single socket, behind any events already queued for it"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        for frame in encode_history(chat_id, rows, chunk_size):
+            self._send(connection, frame)
+
+    def send_replay(self, websocket: WebSocket, chat_id: int, payloads: Sequence[str], chunk_size: int = 0):
+        """Queue already-serialized messages as history frames, all in one unless chunk_size is set"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        chunk_size = chunk_size or len(payloads) or 1
+        for start in range(0, max(len(payloads), 1), chunk_size):
+            self._send(connection, history_frame(chat_id, f'[{",".join(payloads[start:start + chunk_size])}]'))
+
+    def send_error(self, websocket: WebSocket, detail: str, chat_id: Optional[int] = None):
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._send(connection, codec.dumps(ErrorOut(detail=detail, chat_id=chat_id)))
+
+    @staticmethod
+    def _send(connection: ClientConnection, frame: str):
+        """Queue a frame meant for a single socket in the socket's format"""
+        if connection.binary:
+            with msgpack_serialization_seconds.time():
+                connection.enqueue(json_to_msgpack(frame))
+        else:
+            connection.enqueue(frame)
+
+    def recent_history(self, chat_id: int, limit: int) -> Optional[List[str]]:
+        """The newest limit messages of a chat from the history cache, or None on a miss"""
+        if self.history_cache is None:
+            return None
+        payloads = self.history_cache.get(chat_id, limit)
+        if payloads is None and chat_id in self.chat_connections:
+            # Evicted while still subscribed, collect events again until the next seed
+            self.history_cache.track(chat_id)
+        return payloads
+
+    def history_seed_marker(self, chat_id: int) -> Optional[object]:
+        """
+        Call before reading the newest page of a chat from the database and pass the result to seed_history.
+
+        None if the page could miss events: the chat is not cached or its channel is not subscribed.
+        """
+        if self.history_cache is None:
+            return None
+        ready = self.channel_ready.get(self.channel_for(chat_id))
+        if ready is None or not ready.is_set():
+            return None
+        return self.history_cache.seed_marker(chat_id)
+
+    def seed_history(self, chat_id: int, rows: Sequence[Row], limit: int, marker: Optional[object]):
+        """Seed the history cache with the newest page of a chat, as returned for limit"""
+        if marker is None:
+            return
+        entries = [(row.id, codec.dumps(message_from_row(chat_id, row))) for row in rows]
+        self.history_cache.fill(chat_id, entries, marker, exhaustive=len(rows) < limit)
+
+    def _reset_history(self, channel_name: str):
+        """Start the cached history of the channel's chats over, events may have been missed"""
+        if self.history_cache is None:
+            return
+        for chat_id in self.channel_chats.get(channel_name, ()):
+            if self.history_cache.is_tracked(chat_id):
+                self.history_cache.untrack(chat_id)
+                self.history_cache.track(chat_id)
+
+    def backlog_stats(self) -> List[dict]:
+        """Outbound backlog of every local socket"""
+        return [connection.stats() for connection in self.connections.values()]
 
     async def broadcast_to_chat(self, chat_id: int, message: BaseModel):
         """Broadcast a message to all clients in a chat"""
-        channel_name = f"chat:{chat_id}"
-        message_json = message.model_dump_json()
-        await self.broadcast.publish(channel=channel_name, message=message_json)
+        with broadcast_serialization_seconds.time():
+            message_json = codec.dumps(message)
+        await self.publish(chat_id, message_json)
+
+    async def publish(self, chat_id: int, message_json: str):
+        """
+        Publish an already-serialized event to the chat's channel.
+
+        Raises:
+            EventTooLargeError: If the event exceeds max_payload_bytes
+        """
+        await self._publish(chat_id, self._channel_payload(chat_id, message_json))
+
+    async def _publish(self, chat_id: int, payload: str):
+        with broadcast_publish_seconds.time():
+            await self._broadcast_for(chat_id).publish(channel=self.channel_for(chat_id), message=payload)
+
+    def _channel_payload(self, chat_id: int, message_json: str) -> str:
+        """The event as sent over the channel, checked against max_payload_bytes"""
+        if self.shard_count:
+            message_json = f"{chat_id}|{message_json}"
+        if self.max_payload_bytes:
+            size = len(message_json.encode())
+            if size > self.max_payload_bytes:
+                raise EventTooLargeError(
+                    f"Event of {size} bytes exceeds the {self.max_payload_bytes} byte limit of the broadcast backend"
+                )
+        return message_json
+
+    def message_fits(self, chat_id: int, sender_id: int, content: str) -> bool:
+        """Whether a chat message with this content can be broadcast, to check it before storing it"""
+        if not self.max_payload_bytes:
+            return True
+        probe = ChatMessageOut.model_construct(
+            id=MAX_MESSAGE_ID,
+            sender_id=sender_id,
+            content=content,
+            timestamp=MAX_TIMESTAMP,
+            is_read=False,
+            chat_id=chat_id,
+        )
+        try:
+            self._channel_payload(chat_id, codec.dumps(probe))
+        except EventTooLargeError:
+            return False
+        return True
 
     async def broadcast_message(self, chat_id: int, message: ChatMessageOut):
-        """Broadcast a chat message to all clients in the chat"""
-        await self.broadcast_to_chat(chat_id, message)
+        """
+        Broadcast a chat message to all clients in the chat.
+
+        Raises:
+            EventTooLargeError: If the message exceeds max_payload_bytes
+        """
+        if self.message_stream is None:
+            await self.broadcast_to_chat(chat_id, message)
+            return
+        with broadcast_serialization_seconds.time():
+            message_json = codec.dumps(message)
+        payload = self._channel_payload(chat_id, message_json)
+        await self.message_stream.append(chat_id, message.id, message_json)
+        await self._publish(chat_id, payload)
 
     async def broadcast_read_status(self, message_id: int, chat_id: int, reader_id: int):
         """Broadcast that a user has read a message"""
         read_notification = ReadStatusOut(
             message_id=message_id,
             reader_id=reader_id,
-            timestamp=datetime.now(UTC)
+            timestamp=datetime.now(UTC),
+            chat_id=chat_id,
         )
         await self.broadcast_to_chat(chat_id, read_notification)
 
-    async def listen_for_messages(self, websocket: WebSocket, chat_id: int):
-        """Listen for messages on the chat channel and forward them to the WebSocket"""
-        channel_name = f"chat:{chat_id}"
+    def deliver(self, chat_id: int, payload: str):
+        """Handle an event received from the chat's channel"""
+        if self.history_cache is not None and payload.startswith(MESSAGE_PREFIX):
+            start = len(MESSAGE_PREFIX)
+            self.history_cache.append(chat_id, int(payload[start:payload.index(",", start)]), payload)
+        elif self.history_cache is not None and payload.startswith(READ_STATUS_PREFIX):
+            if self.history_cache.is_tracked(chat_id):
+                event = codec.loads(payload)
+                self.history_cache.mark_read(chat_id, event["reader_id"], event["message_id"])
+        self.fan_out(chat_id, payload)
+
+    def fan_out(self, chat_id: int, payload: str):
+        """Queue an already-serialized payload for every local socket in the chat"""
+        connections = self.chat_connections.get(chat_id)
+        if not connections:
+            return
+        coalesce_key = self._coalesce_key(chat_id, payload) if self.coalesce_read_status else None
+        # Encoded at most once per format, however many sockets use it
+        binary_payload = None
+        for connection in list(connections):
+            if not connection.binary:
+                connection.enqueue(payload, coalesce_key)
+                continue
+            if binary_payload is None:
+                with msgpack_serialization_seconds.time():
+                    binary_payload = json_to_msgpack(payload)
+            connection.enqueue(binary_payload, coalesce_key)
+
+    @staticmethod
+    def _coalesce_key(chat_id: int, payload: str) -> Optional[Hashable]:
+        """Read status events from the same reader in the same chat replace each other while queued"""
+        if not payload.startswith(READ_STATUS_PREFIX):
+            return None
+        return "read_status", chat_id, codec.loads(payload)["reader_id"]
+
+    async def listen_for_messages(self, chat_id: int):
+        """
+        Listen for messages on the chat's channel and fan them out to local WebSockets.
+
+        If the subscription fails, it is retried with exponential backoff for as long as local
+        chats are routed through the channel.
+        """
+        channel_name = self.channel_for(chat_id)
+        delay = self.RESUBSCRIBE_DELAY
         try:
-            async with self.broadcast.subscribe(channel=channel_name) as subscriber:
-                async for event in subscriber:
-                    try:
-                        # The message is already JSON-serialized when published
-                        await websocket.send_text(event.message)
-                    except WebSocketDisconnect:
-                        await self.disconnect(websocket)
-                        break
+            while channel_name in self.channel_chats:
+                try:
+                    async with self._broadcast_for(chat_id).subscribe(channel=channel_name) as subscriber:
+                        ready = self.channel_ready.get(channel_name)
+                        if ready is not None:
+                            ready.set()
+                        delay = self.RESUBSCRIBE_DELAY
+                        async for event in subscriber:
+                            self._deliver_event(chat_id, event.message)
+                    break  # Unsubscribed, the broadcaster is disconnecting
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error listening on {channel_name}, resubscribing in {delay}s: {str(e)}")
+                    ready = self.channel_ready.get(channel_name)
+                    if ready is not None:
+                        ready.clear()
+                    self._reset_history(channel_name)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.RESUBSCRIBE_MAX_DELAY)
         except CancelledError:
             pass  # Ignore cancellation errors
+        finally:
+            if self.listing_tasks.get(channel_name) is asyncio.current_task():
+                self.listing_tasks.pop(channel_name, None)
+                self.channel_ready.pop(channel_name, None)
 
-    async def get_chat_lock(self, chat_id: int) -> asyncio.Lock:
-        """Get or create a lock for a specific chat"""
-        if chat_id not in self.chat_locks:
-            self.chat_locks[chat_id] = asyncio.Lock()
-        return self.chat_locks[chat_id]
+    def _deliver_event(self, chat_id: int, message: str):
+        try:
+            # The message is already JSON-serialized when published
+            if not self.shard_count:
+                self.deliver(chat_id, message)
+                return
+            # Shard channels carry "<chat_id>|<payload>"
+            target, _, payload = message.partition("|")
+            self.deliver(int(target), payload)
+        except Exception as e:
+            print(f"Error delivering event: {str(e)}")
@@ -1,31 +1,63 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
 from app.core.containers import Container
-from app.api import chat_routes, websocket_routes, user_routes
+from app.api import chat_routes, metrics_routes, search_routes, websocket_routes, user_routes
 from app.core.db import create_tables
+from app.core.hashing import PasswordHasherBusyError
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     container = app.container
     await container.broadcaster().connect()
-    await create_tables() # Better use alembic for migrations, but this is a simple example
+    await container.broadcast_pool().connect()
+    await container.membership_cache().start()
+    await container.token_cache().start()
+    await container.message_stream().start()
+    await create_tables(container.db_engine()) # Better use alembic for migrations, but this is a simple example
+    await container.partition_manager().start()
+    await container.id_generator().start()
+    await container.message_writer().start()
+    await container.read_receipts().start()
     
     yield
     
+    await container.read_receipts().stop()
+    await container.message_writer().stop()
+    await container.id_generator().stop()
+    await container.partition_manager().stop()
+    await container.message_stream().stop()
+    await container.token_cache().stop()
+    await container.membership_cache().stop()
+    await container.broadcast_pool().disconnect()
     await container.broadcaster().disconnect()
+    await container.db_engine().dispose()
+    container.password_hasher().shutdown()
+
+
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusyError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
 
 
 def create_app() -> FastAPI:
     container = Container()
     app = FastAPI(lifespan=lifespan)
     app.container = container
+    app.add_exception_handler(PasswordHasherBusyError, password_hasher_busy_handler)
 
     # Include routers
     app.include_router(user_routes.router)
     app.include_router(chat_routes.router)
+    app.include_router(search_routes.router)
     app.include_router(websocket_routes.router)
+    app.include_router(metrics_routes.router)
+    metrics_routes.register_collectors(container)
 
     return app
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import BigInteger, Column, Integer, ForeignKey, DateTime, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -12,6 +12,8 @@ class ChatParticipant(Base):
     chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     joined_at = Column(DateTime, server_default=func.now(), nullable=False)
+    # Read watermark: every message up to this ID has been read by the participant
+    last_read_message_id = Column(BigInteger, default=0, server_default="0", nullable=False)
 
     chat = relationship("Chat", back_populates="participants")
     user = relationship("User", back_populates="chats")
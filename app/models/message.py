@@ -1,17 +1,41 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import DDL, BigInteger, Column, Integer, String, ForeignKey, DateTime, Boolean, Index, event, func
 from sqlalchemy.orm import relationship
+from app.core.config import settings
 from app.core.db import Base
 
+# Range partitioned by timestamp on PostgreSQL, the partition key has to be part of the primary key
+PARTITIONED = bool(settings.MESSAGE_PARTITION_INTERVAL)
+
 
 class Message(Base):
     __tablename__ = "messages"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # 64-bit for in-process snowflake IDs, SQLite only autoincrements INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, index=True, autoincrement=True)
     chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     text = Column(String, nullable=False)
-    timestamp = Column(DateTime, server_default="now()", nullable=False)
+    timestamp = Column(DateTime, server_default=func.now(), nullable=False, primary_key=PARTITIONED)
+    # Not maintained, reads compute it from the participants' read watermarks
     is_read = Column(Boolean, default=False)
 
     sender = relationship("User", back_populates="messages_sent")
     chat = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        # Keyset pagination of chat history
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"} if PARTITIONED else {},
+    )
+
+
+# Full-text search on PostgreSQL: a generated tsvector column with a GIN index.
+# It is not mapped, so loading messages never reads it.
+SEARCH_VECTOR_COLUMN = "search_vector"
+
+for statement in (
+    f"ALTER TABLE messages ADD COLUMN IF NOT EXISTS {SEARCH_VECTOR_COLUMN} tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('{settings.SEARCH_TEXT_CONFIG}'::regconfig, text)) STORED",
+    f"CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING gin ({SEARCH_VECTOR_COLUMN})",
+):
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
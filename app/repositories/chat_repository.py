@@ -1,62 +1,100 @@
 from typing import Sequence
 
-from sqlalchemy import select
+from sqlalchemy import Row, exists, func, insert, literal, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.core.metrics import repository_query_seconds, timed
+from app.core.membership_cache import MembershipCache
 from app.models.chat import Chat, ChatType
 from app.models.chat_participant import ChatParticipant
+from app.models.message import Message
+
+# Columns selected by the projection-only read paths
+CHAT_ROW_COLUMNS = (Chat.id, Chat.name, Chat.type, Chat.creator_id)
+
+
+# Participants per INSERT statement, two bind parameters each
+PARTICIPANT_INSERT_BATCH = 10_000
+
+
+def resolve_participant_ids(type_: ChatType, participant_ids: list[int], creator_id: int | None = None) -> list[int]:
+    """Deduplicated participant IDs in request order, with the creator added to group chats
+
+    Raises:
+        ValueError: If there are fewer than 2 participants
+        ValueError: If creator_id is not provided for a group chat
+    """
+    if len(participant_ids) < 2:
+        raise ValueError("Chat must have at least 2 participants")
+
+    if type_ == ChatType.group and creator_id is None:
+        raise ValueError("Group chat must have a creator")
+
+    member_ids = list(dict.fromkeys(participant_ids))
+
+    # Ensure creator is in the participants list for group chats
+    if type_ == ChatType.group and creator_id not in member_ids:
+        member_ids.append(creator_id)
+
+    return member_ids
 
 
 class ChatRepository:
-    def __init__(self, session_factory):
+    def __init__(self, session_factory, membership_cache: MembershipCache | None = None):
         self.session_factory = session_factory
+        self.membership_cache = membership_cache
 
+    @timed(repository_query_seconds)
     async def create(self, name: str, type_: ChatType, participant_ids: list[int], creator_id: int = None, load_relationships: bool = False) -> Chat:
         """Create a new chat with participants
 
+        The chat is inserted first and all participants follow in one multi-row INSERT.
+        Without load_relationships nothing is read back, the returned chat has its columns set.
+
         Args:
             name: The name of the chat
             type_: The type of chat (personal or group)
             participant_ids: List of all participant user IDs
             creator_id: The ID of the user who created the chat (required for group chats)
-            load_relationships: Whether to load related entities
+            load_relationships: Whether to load participants and creator
 
         Raises:
             ValueError: If there are fewer than 2 participants
             ValueError: If creator_id is not provided for a group chat
         """
-        if len(participant_ids) < 2:
-            raise ValueError("Chat must have at least 2 participants")
-
-        if type_ == ChatType.group and creator_id is None:
-            raise ValueError("Group chat must have a creator")
-
-        unique_participant_ids = list(set(participant_ids))
-
-        # Ensure creator is in the participants list for group chats
-        if type_ == ChatType.group and creator_id not in unique_participant_ids:
-            unique_participant_ids.append(creator_id)
+        member_ids = resolve_participant_ids(type_, participant_ids, creator_id)
 
         async with self.session_factory() as session:
             new_chat = Chat(name=name, type=type_, creator_id=creator_id)
             session.add(new_chat)
             await session.flush()
 
-            for user_id in unique_participant_ids:
-                participant = ChatParticipant(chat_id=new_chat.id, user_id=user_id)
-                session.add(participant)
+            rows = [{"chat_id": new_chat.id, "user_id": user_id} for user_id in member_ids]
+            for start in range(0, len(rows), PARTICIPANT_INSERT_BATCH):
+                await session.execute(insert(ChatParticipant).values(rows[start:start + PARTICIPANT_INSERT_BATCH]))
 
             await session.commit()
-            
+
+            if self.membership_cache is not None:
+                # Other workers may have cached the ID as an empty chat
+                await self.membership_cache.invalidate(new_chat.id)
+                self.membership_cache.set(new_chat.id, member_ids)
+
             if load_relationships:
-                await session.refresh(new_chat, ["participants", "messages", "creator"])
-            else:
-                await session.refresh(new_chat)
-                
+                await session.refresh(new_chat, ["participants", "creator"])
+
             return new_chat
 
-    async def get_by_id(self, chat_id: int, load_relationships: bool = False) -> Chat | None:
+    @timed(repository_query_seconds)
+    async def get_by_id(self, chat_id: int, load_relationships: bool = False, load_participants: bool = False) -> Chat | None:
+        """Get a chat by ID
+
+        Args:
+            chat_id: The ID of the chat
+            load_relationships: Whether to load participants, messages and creator
+            load_participants: Whether to load only the participants (membership profile)
+        """
         async with self.session_factory() as session:
             stmt = select(Chat).where(Chat.id == chat_id)
             
@@ -66,10 +104,89 @@ class ChatRepository:
                     selectinload(Chat.messages),
                     selectinload(Chat.creator)
                 )
+            elif load_participants:
+                stmt = stmt.options(selectinload(Chat.participants))
                 
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
 
+    @timed(repository_query_seconds)
+    async def exists(self, chat_id: int) -> bool:
+        async with self.session_factory() as session:
+            result = await session.execute(select(exists().where(Chat.id == chat_id)))
+            return result.scalar()
+
+    @timed(repository_query_seconds)
+    async def get_member_ids(self, chat_id: int) -> frozenset[int]:
+        """Get the IDs of all participants of a chat, served from the membership cache when available"""
+        if self.membership_cache is None:
+            return frozenset(await self._load_member_ids(chat_id))
+        return await self.membership_cache.get_or_load(chat_id, lambda: self._load_member_ids(chat_id))
+
+    async def _load_member_ids(self, chat_id: int) -> Sequence[int]:
+        async with self.session_factory() as session:
+            stmt = select(ChatParticipant.user_id).where(ChatParticipant.chat_id == chat_id)
+            result = await session.execute(stmt)
+            return result.scalars().all()
+
+    @timed(repository_query_seconds)
+    async def is_participant(self, chat_id: int, user_id: int) -> bool:
+        """Check chat membership, using the membership cache or a single EXISTS query"""
+        if self.membership_cache is not None:
+            return user_id in await self.get_member_ids(chat_id)
+
+        async with self.session_factory() as session:
+            stmt = select(
+                exists().where(
+                    ChatParticipant.chat_id == chat_id,
+                    ChatParticipant.user_id == user_id,
+                )
+            )
+            result = await session.execute(stmt)
+            return result.scalar()
+
+    @timed(repository_query_seconds)
+    async def update_read_watermarks(
+            self,
+            watermarks: dict[tuple[int, int], Sequence[int]],
+    ) -> list[tuple[int, int, int]]:
+        """Move read watermarks forward in a single transaction
+
+        Each watermark is advanced with a monotonic UPDATE to the highest of its candidate
+        message IDs that belongs to the chat, if that is newer than the current watermark.
+
+        Args:
+            watermarks: Mapping of (chat_id, user_id) to candidate last read message IDs
+
+        Returns:
+            (chat_id, user_id, message_id) for every watermark that actually moved
+        """
+        advanced = []
+        async with self.session_factory() as session:
+            for (chat_id, user_id), message_ids in watermarks.items():
+                newest = (
+                    select(func.max(Message.id))
+                    .where(Message.id.in_(message_ids), Message.chat_id == chat_id)
+                    .scalar_subquery()
+                )
+                stmt = (
+                    update(ChatParticipant)
+                    .where(
+                        ChatParticipant.chat_id == chat_id,
+                        ChatParticipant.user_id == user_id,
+                        ChatParticipant.last_read_message_id < newest,
+                    )
+                    .values(last_read_message_id=newest)
+                    .returning(ChatParticipant.last_read_message_id)
+                )
+                result = await session.execute(stmt)
+                message_id = result.scalar_one_or_none()
+                if message_id is not None:
+                    advanced.append((chat_id, user_id, message_id))
+            await session.commit()
+        return advanced
+
+    @timed(repository_query_seconds)
     async def list_chats(self, user_id: int, limit: int = 100, offset: int = 0, load_relationships: bool = False) -> Sequence[Chat]:
         """List chats where the specified user is a participant"""
         async with self.session_factory() as session:
@@ -90,3 +207,78 @@ class ChatRepository:
                 
             result = await session.execute(stmt)
             return result.scalars().all()
+
+    @timed(repository_query_seconds)
+    async def list_chat_ids(self, user_id: int, chat_ids: Sequence[int] | None = None) -> list[int]:
+        """IDs of the chats where the user is a participant, optionally limited to chat_ids"""
+        async with self.session_factory() as session:
+            stmt = select(ChatParticipant.chat_id).where(ChatParticipant.user_id == user_id)
+            if chat_ids is not None:
+                stmt = stmt.where(ChatParticipant.chat_id.in_(chat_ids))
+            result = await session.execute(stmt.order_by(ChatParticipant.chat_id))
+            return list(result.scalars().all())
+
+    @timed(repository_query_seconds)
+    async def list_inbox_rows(self, user_id: int, limit: int = 100, offset: int = 0, unread_limit: int = 1000) -> Sequence[Row]:
+        """List the user's chats with their newest message ID and unread count, most recently active first
+
+        Both values come from correlated subqueries on the (chat_id, id) message index, so the
+        cost grows with the number of chats, not with the number of messages in them. Unread
+        messages are those from other participants after the read watermark, counted up to
+        unread_limit.
+
+        Returns:
+            (id, name, type, creator_id, last_read_message_id, last_message_id, unread_count) rows
+        """
+        last_message_id = (
+            select(func.max(Message.id))
+            .where(Message.chat_id == Chat.id)
+            .correlate(Chat)
+            .scalar_subquery()
+            .label("last_message_id")
+        )
+        unread = (
+            select(literal(1))
+            .where(
+                Message.chat_id == Chat.id,
+                Message.id > ChatParticipant.last_read_message_id,
+                Message.sender_id != user_id,
+            )
+            .correlate(Chat, ChatParticipant)
+            .limit(unread_limit)
+            .subquery()
+        )
+        unread_count = select(func.count()).select_from(unread).scalar_subquery().label("unread_count")
+
+        async with self.session_factory() as session:
+            stmt = (
+                select(
+                    *CHAT_ROW_COLUMNS,
+                    ChatParticipant.last_read_message_id,
+                    last_message_id,
+                    unread_count,
+                )
+                .join(ChatParticipant, Chat.id == ChatParticipant.chat_id)
+                .where(ChatParticipant.user_id == user_id)
+                .order_by(last_message_id.desc().nulls_last(), Chat.id.desc())
+                .limit(limit)
+                .offset(offset)
+            )
+            result = await session.execute(stmt)
+            return result.all()
+
+    @timed(repository_query_seconds)
+    async def get_participant_ids(self, chat_ids: Sequence[int]) -> dict[int, list[int]]:
+        """Participant IDs of several chats in one query"""
+        participants: dict[int, list[int]] = {chat_id: [] for chat_id in chat_ids}
+        if not chat_ids:
+            return participants
+        async with self.session_factory() as session:
+            stmt = (
+                select(ChatParticipant.chat_id, ChatParticipant.user_id)
+                .where(ChatParticipant.chat_id.in_(chat_ids))
+                .order_by(ChatParticipant.chat_id, ChatParticipant.user_id)
+            )
+            for chat_id, user_id in (await session.execute(stmt)).all():
+                participants[chat_id].append(user_id)
+        return participants
@@ -1,16 +1,110 @@
 from typing import Sequence
 
-from sqlalchemy import select, asc
+from sqlalchemy import (
+    Integer, Row, Select, Subquery, case, cast, func, insert, literal, literal_column, null, select, asc, desc, tuple_,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from app.models.message import Message
+from app.core.config import settings
+from app.core.message_archive import MessageArchive
+from app.core.metrics import repository_query_seconds, timed
+from app.core.partitions import PARTITION_BOUNDARY_SLACK, PARTITION_SCAN_WINDOWS, MessagePartitionManager
+from app.models.chat_participant import ChatParticipant
+from app.models.message import SEARCH_VECTOR_COLUMN, Message
+
+# Columns selected by the projection-only read paths, together with read_status_column
+MESSAGE_ROW_COLUMNS = (Message.id, Message.sender_id, Message.chat_id, Message.text, Message.timestamp)
+
+
+def read_watermarks(chat_ids) -> Subquery:
+    """
+    The two highest read watermarks of each chat in chat_ids, a list or a subquery, and the reader of the first.
+
+    A message is read once any participant other than its sender has read up to it, which is
+    the highest watermark unless the sender holds it, then the second highest. Participants are
+    read once per query, not once per message.
+    """
+    ranked = (
+        select(
+            ChatParticipant.chat_id,
+            ChatParticipant.user_id,
+            ChatParticipant.last_read_message_id,
+            func.row_number().over(
+                partition_by=ChatParticipant.chat_id, order_by=desc(ChatParticipant.last_read_message_id),
+            ).label("rank"),
+        )
+        .where(ChatParticipant.chat_id.in_(chat_ids))
+        .subquery()
+    )
+    return (
+        select(
+            ranked.c.chat_id,
+            func.max(case((ranked.c.rank == 1, ranked.c.last_read_message_id))).label("first_read"),
+            func.max(case((ranked.c.rank == 1, ranked.c.user_id))).label("first_reader"),
+            func.max(case((ranked.c.rank == 2, ranked.c.last_read_message_id))).label("second_read"),
+        )
+        .where(ranked.c.rank <= 2)
+        .group_by(ranked.c.chat_id)
+        .subquery("read_watermarks")
+    )
+
+
+def read_status_column(watermarks: Subquery):
+    """is_read of the messages, the query has to outer join watermarks on chat_id"""
+    others_read = case(
+        (watermarks.c.first_reader == Message.sender_id, watermarks.c.second_read),
+        else_=watermarks.c.first_read,
+    )
+    return (Message.id <= func.coalesce(others_read, 0)).label("is_read")
+
+
+def select_message_rows(chat_ids, *columns) -> Select:
+    """MESSAGE_ROW_COLUMNS with is_read and any extra columns, for messages of the chats in chat_ids"""
+    watermarks = read_watermarks(chat_ids)
+    return (
+        select(*MESSAGE_ROW_COLUMNS, read_status_column(watermarks), *columns)
+        .select_from(Message)
+        .outerjoin(watermarks, watermarks.c.chat_id == Message.chat_id)
+    )
+
+
+def is_read_by_others(message_id: int, sender_id: int, watermarks: Row | None) -> bool:
+    """Same as read_status_column, for messages not read from the database, with a read_watermarks row"""
+    if watermarks is None:
+        return False
+    others_read = watermarks.second_read if watermarks.first_reader == sender_id else watermarks.first_read
+    return message_id <= (others_read or 0)
+
+
+# ts_rank is stored as an integer score so it can be used in keyset cursors
+SEARCH_SCORE_SCALE = 1_000_000
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+# Snippets are HTML with only the <mark> tags live, so the text is escaped before ts_headline
+HTML_ESCAPES = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("'", "&#x27;"))
+
+
+def html_escaped(column):
+    for char, entity in HTML_ESCAPES:
+        column = func.replace(column, char, entity)
+    return column
 
 
 class MessageRepository:
-    def __init__(self, session_factory):
+    def __init__(
+            self,
+            session_factory,
+            partitions: MessagePartitionManager | None = None,
+            archive: MessageArchive | None = None,
+    ):
         self.session_factory = session_factory
+        self.partitions = partitions
+        self.archive = archive
 
+    @timed(repository_query_seconds)
     async def create(self, chat_id: int, sender_id: int, text: str, load_relationships: bool = False) -> Message:
         async with self.session_factory() as session:
             new_message = Message(
@@ -28,46 +122,214 @@ class MessageRepository:
                 
             return new_message
 
-    async def get_history(self, chat_id: int, limit: int = 50, offset: int = 0, load_relationships: bool = False) -> Sequence[Message]:
+    @timed(repository_query_seconds)
+    async def create_many(self, messages: list[dict]) -> Sequence[Row]:
+        """Insert messages with a single multi-row INSERT ... RETURNING id, timestamp
+
+        Args:
+            messages: Dicts with chat_id, sender_id and text
+
+        Returns:
+            Rows with id and timestamp, in the same order as the input
+        """
         async with self.session_factory() as session:
-            stmt = (
-                select(Message)
-                .where(Message.chat_id == chat_id)
-                .order_by(asc(Message.timestamp))
-                .limit(limit)
-                .offset(offset)
-            )
-            
+            stmt = insert(Message).returning(Message.id, Message.timestamp, sort_by_parameter_order=True)
+            result = await session.execute(stmt, messages)
+            created = result.all()
+            await session.commit()
+            return created
+
+    @timed(repository_query_seconds)
+    async def get_history(
+            self,
+            chat_id: int,
+            limit: int = 50,
+            before_id: int | None = None,
+            after_id: int | None = None,
+            load_relationships: bool = False
+    ) -> Sequence[Message]:
+        """Get a page of chat history using keyset pagination on (chat_id, id)
+
+        Without cursors the newest messages are returned. With before_id the page ends right
+        before that message, with after_id it starts right after it.
+        Messages are always returned in ascending order.
+        """
+        async with self.session_factory() as session:
+            stmt = select(Message).where(Message.chat_id == chat_id)
+
+            if before_id is not None:
+                stmt = stmt.where(Message.id < before_id)
+            if after_id is not None:
+                stmt = stmt.where(Message.id > after_id)
+
+            newest_first = after_id is None
+            stmt = stmt.order_by(desc(Message.id) if newest_first else asc(Message.id)).limit(limit)
+
             if load_relationships:
                 stmt = stmt.options(
                     selectinload(Message.sender),
                     selectinload(Message.chat)
                 )
-                
+
             result = await session.execute(stmt)
-            return result.scalars().all()
+            messages = result.scalars().all()
+            if newest_first:
+                messages = messages[::-1]
+
+            # The stored is_read column is not maintained, read status comes from the watermarks
+            watermarks = await self._read_watermarks(session, chat_id)
+            for message in messages:
+                set_committed_value(message, "is_read", is_read_by_others(message.id, message.sender_id, watermarks))
+            return messages
+
+    @timed(repository_query_seconds)
+    async def get_history_rows(
+            self,
+            chat_id: int,
+            limit: int = 50,
+            before_id: int | None = None,
+            after_id: int | None = None,
+    ) -> Sequence[Row]:
+        """Same page as get_history, as (id, sender_id, chat_id, text, timestamp, is_read) rows without ORM objects
+
+        With a partitioned table the newest-first pages are read one partition at a time,
+        newest partition first, until the page is full. After PARTITION_SCAN_WINDOWS partitions
+        the rest are read with a single query. Messages of archived partitions are read from
+        the archive when the database does not have enough of them.
+        """
+        newest_first = after_id is None
+        archived = []
+        if not newest_first and self.archive is not None:
+            # Archived messages are older than everything in the database
+            archived = await self._archived_rows(chat_id, limit, before_id=before_id, after_id=after_id)
+            if len(archived) == limit:
+                return archived
+            if archived:
+                after_id = archived[-1].id
 
-    async def mark_as_read(self, message_id: int, load_relationships: bool = False):
         async with self.session_factory() as session:
-            stmt = select(Message).where(Message.id == message_id)
-            
-            if load_relationships:
-                stmt = stmt.options(
-                    selectinload(Message.sender),
-                    selectinload(Message.chat)
+            stmt = select_message_rows([chat_id]).where(Message.chat_id == chat_id)
+
+            if before_id is not None:
+                stmt = stmt.where(Message.id < before_id)
+            if after_id is not None:
+                stmt = stmt.where(Message.id > after_id)
+
+            windows = self.partitions.windows() if newest_first and self.partitions is not None else []
+            if windows:
+                rows = []
+                for index, (start, end) in enumerate(windows):
+                    rest = index == PARTITION_SCAN_WINDOWS
+                    if rest:
+                        # A quiet chat, the older partitions are read with one query instead of one each
+                        page = stmt.where(Message.timestamp < end)
+                    else:
+                        # Bounds on the partition key let the planner prune every other partition
+                        page = stmt.where(Message.timestamp >= start, Message.timestamp < end)
+                    result = await session.execute(page.order_by(desc(Message.id)).limit(limit))
+                    rows = sorted([*rows, *result.all()], key=lambda row: row.id, reverse=True)[:limit]
+                    if rest or (len(rows) == limit and rows[-1].timestamp >= start + PARTITION_BOUNDARY_SLACK):
+                        break
+            else:
+                stmt = stmt.order_by(desc(Message.id) if newest_first else asc(Message.id)).limit(limit - len(archived))
+                result = await session.execute(stmt)
+                rows = result.all()
+
+        if not newest_first:
+            return [*archived, *rows]
+        rows = rows[::-1]
+        if len(rows) < limit and self.archive is not None:
+            older = await self._archived_rows(chat_id, limit - len(rows), before_id=rows[0].id if rows else before_id)
+            rows = [*older, *rows]
+        return rows
+
+    async def _archived_rows(self, chat_id: int, limit: int, **cursor) -> list:
+        """Archived history rows, with the read status the database rows would have"""
+        rows = await self.archive.get_history_rows(chat_id, limit, **cursor)
+        if not rows:
+            return rows
+        async with self.session_factory() as session:
+            watermarks = await self._read_watermarks(session, chat_id)
+        return [row._replace(is_read=is_read_by_others(row.id, row.sender_id, watermarks)) for row in rows]
+
+    @staticmethod
+    async def _read_watermarks(session: AsyncSession, chat_id: int) -> Row | None:
+        watermarks = read_watermarks([chat_id])
+        result = await session.execute(select(watermarks))
+        return result.first()
+
+    @timed(repository_query_seconds)
+    async def get_rows_by_ids(self, message_ids: Sequence[int]) -> dict[int, Row]:
+        """(id, sender_id, chat_id, text, timestamp, is_read) rows of several messages, keyed by ID"""
+        if not message_ids:
+            return {}
+        async with self.session_factory() as session:
+            chat_ids = select(Message.chat_id).where(Message.id.in_(message_ids)).correlate(None)
+            stmt = select_message_rows(chat_ids).where(Message.id.in_(message_ids))
+            result = await session.execute(stmt)
+            return {row.id: row for row in result.all()}
+
+    @timed(repository_query_seconds)
+    async def search(
+            self,
+            query: str,
+            chat_id: int | None = None,
+            user_id: int | None = None,
+            limit: int = 20,
+            before: tuple[int, int] | None = None,
+            highlight: bool = True,
+    ) -> Sequence[Row]:
+        """Find messages of one chat, or of every chat of user_id, best matches first
+
+        On PostgreSQL the query is parsed with websearch_to_tsquery and matched against the
+        GIN-indexed search_vector column, results are ordered by (score, id) descending and
+        HTML-escaped snippets are only built for the returned page. Other databases fall back
+        to a case-insensitive substring match ordered by ID with a score of 0.
+
+        Args:
+            query: Search query, quoted phrases, OR and -word are supported on PostgreSQL
+            chat_id: Only search this chat
+            user_id: Only search the chats this user participates in
+            limit: Maximum number of results
+            before: (score, id) of the last result of the previous page
+            highlight: Whether to build snippets
+
+        Returns:
+            Rows with the MESSAGE_ROW_COLUMNS, is_read, score and snippet
+        """
+        async with self.session_factory() as session:
+            if session.bind.dialect.name == "postgresql":
+                config = cast(literal(settings.SEARCH_TEXT_CONFIG), REGCONFIG)
+                tsquery = func.websearch_to_tsquery(config, query)
+                vector = literal_column(f"messages.{SEARCH_VECTOR_COLUMN}")
+                score = cast(func.ts_rank(vector, tsquery) * SEARCH_SCORE_SCALE, Integer)
+                condition = vector.op("@@")(tsquery)
+                snippet = (
+                    func.ts_headline(config, html_escaped(Message.text), tsquery, SEARCH_HEADLINE_OPTIONS)
+                    if highlight else null()
                 )
-                
+            else:
+                score = literal(0)
+                condition = func.lower(Message.text).contains(query.lower(), autoescape=True)
+                snippet = null()
+
+            score_label = score.label("score")
+            page = select(Message.id, Message.chat_id, score_label).where(condition)
+            if chat_id is not None:
+                page = page.where(Message.chat_id == chat_id)
+            if user_id is not None:
+                page = page.where(
+                    Message.chat_id.in_(select(ChatParticipant.chat_id).where(ChatParticipant.user_id == user_id))
+                )
+            if before is not None:
+                page = page.where(tuple_(score, Message.id) < tuple_(*before))
+            page = page.order_by(desc(score_label), desc(Message.id)).limit(limit).subquery()
+
+            # Snippets are computed in the outer query, only for the rows of the page
+            stmt = (
+                select_message_rows(select(page.c.chat_id), page.c.score, snippet.label("snippet"))
+                .join(page, Message.id == page.c.id)
+                .order_by(desc(page.c.score), desc(Message.id))
+            )
             result = await session.execute(stmt)
-            message = result.scalar_one_or_none()
-            
-            if message:
-                message.is_read = True
-                await session.commit()
-                
-                # Refresh with relationships if requested
-                if load_relationships:
-                    await session.refresh(message, ["sender", "chat"])
-                else:
-                    await session.refresh(message)
-                    
-            return message
+            return result.all()
@@ -1,7 +1,10 @@
+from typing import Iterable
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
+from app.core.metrics import repository_query_seconds, timed
 from app.models.user import User
 
 
@@ -9,6 +12,7 @@ class UserRepository:
     def __init__(self, session_factory):
         self.session_factory = session_factory
 
+    @timed(repository_query_seconds)
     async def get_by_email(self, email: str, load_relationships: bool = False) -> User | None:
         async with self.session_factory() as session:
             stmt = select(User).where(User.email == email)
@@ -23,6 +27,7 @@ class UserRepository:
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
 
+    @timed(repository_query_seconds)
     async def create(self, name: str, email: str, hashed_password: str, load_relationships: bool = False) -> User:
         async with self.session_factory() as session:
             user = User(name=name, email=email, password=hashed_password)
@@ -37,6 +42,7 @@ class UserRepository:
                 
             return user
 
+    @timed(repository_query_seconds)
     async def get_by_id(self, user_id: int, load_relationships: bool = False) -> User | None:
         async with self.session_factory() as session:
             stmt = select(User).where(User.id == user_id)
@@ -50,3 +56,13 @@ class UserRepository:
                 
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
+
+    @timed(repository_query_seconds)
+    async def get_existing_ids(self, user_ids: Iterable[int]) -> set[int]:
+        """The subset of user_ids that exist, checked with a single query"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return set()
+        async with self.session_factory() as session:
+            result = await session.execute(select(User.id).where(User.id.in_(user_ids)))
+            return set(result.scalars().all())
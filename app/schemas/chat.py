@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from app.models.chat import ChatType
+from app.schemas.message import MessageResponse
 
 
 class ChatCreate(BaseModel):
@@ -16,3 +17,15 @@ class ChatResponse(BaseModel):
     type: ChatType
     participant_ids: List[int]
     creator_id: Optional[int] = None
+
+
+class ChatSummaryResponse(BaseModel):
+    """A chat in the user's inbox with its newest message and unread count"""
+    id: int
+    name: str
+    type: ChatType
+    participant_ids: List[int]
+    creator_id: Optional[int] = None
+    last_read_message_id: int
+    unread_count: int
+    last_message: Optional[MessageResponse] = None
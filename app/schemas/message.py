@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -13,3 +15,22 @@ class MessageResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class MessageHistoryResponse(BaseModel):
+    """A page of chat history with opaque cursors for the neighbouring pages"""
+    messages: List[MessageResponse]
+    older_cursor: Optional[str] = None
+    newer_cursor: Optional[str] = None
+
+
+class SearchResult(MessageResponse):
+    """A message matching a search query, snippet is escaped HTML with the matches wrapped in <mark> tags"""
+    score: int
+    snippet: Optional[str] = None
+
+
+class SearchResponse(BaseModel):
+    """A page of search results, best matches first"""
+    results: List[SearchResult]
+    next_cursor: Optional[str] = None
@@ -1,13 +1,17 @@
 from enum import Enum
 from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import Annotated, Optional, Literal, Union
 
 
 class MessageType(str, Enum):
     """Types of websocket messages"""
     MESSAGE = "message"
     READ_STATUS = "read_status"
+    HISTORY = "history"
+    SUBSCRIBE = "subscribe"
+    UNSUBSCRIBE = "unsubscribe"
+    ERROR = "error"
 
 
 class BaseWebSocketMessage(BaseModel):
@@ -16,9 +20,10 @@ class BaseWebSocketMessage(BaseModel):
 
 
 class ChatMessageIn(BaseWebSocketMessage):
-    """Message received from a client"""
+    """Message received from a client, chat_id is required on the multiplexed socket"""
     type: Literal[MessageType.MESSAGE] = MessageType.MESSAGE
     content: str
+    chat_id: Optional[int] = None
 
 
 class ChatMessageOut(BaseWebSocketMessage):
@@ -29,17 +34,47 @@ class ChatMessageOut(BaseWebSocketMessage):
     content: str
     timestamp: datetime
     is_read: bool
+    chat_id: Optional[int] = None
 
 
 class ReadStatusIn(BaseWebSocketMessage):
-    """Read status notification from a client"""
+    """Read status notification from a client: everything up to message_id has been read"""
     type: Literal[MessageType.READ_STATUS] = MessageType.READ_STATUS
     message_id: int
+    chat_id: Optional[int] = None
 
 
 class ReadStatusOut(BaseWebSocketMessage):
-    """Read status notification to clients"""
+    """Read status notification to clients: reader_id has read everything up to message_id"""
     type: Literal[MessageType.READ_STATUS] = MessageType.READ_STATUS
     message_id: int
     reader_id: int
     timestamp: datetime
+    chat_id: Optional[int] = None
+
+
+class SubscribeIn(BaseWebSocketMessage):
+    """Start receiving a chat's events on the multiplexed socket, with history after resume_from"""
+    type: Literal[MessageType.SUBSCRIBE] = MessageType.SUBSCRIBE
+    chat_id: int
+    resume_from: Optional[int] = None
+
+
+class UnsubscribeIn(BaseWebSocketMessage):
+    """Stop receiving a chat's events on the multiplexed socket"""
+    type: Literal[MessageType.UNSUBSCRIBE] = MessageType.UNSUBSCRIBE
+    chat_id: int
+
+
+class ErrorOut(BaseWebSocketMessage):
+    """A client frame that could not be handled"""
+    type: Literal[MessageType.ERROR] = MessageType.ERROR
+    chat_id: Optional[int] = None
+    detail: str
+
+
+# Any frame a client may send, discriminated by "type"
+ClientFrame = Annotated[
+    Union[ChatMessageIn, ReadStatusIn, SubscribeIn, UnsubscribeIn],
+    Field(discriminator="type"),
+]
@@ -0,0 +1,205 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Deque, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import Row
+
+from app.core.snowflake import SnowflakeGenerator
+from app.repositories.message_repository import MessageRepository
+
+
+def text_error(text: str) -> Optional[str]:
+    """Why PostgreSQL would reject a message text, None if it can be stored"""
+    if "\x00" in text:
+        return "Message contains NUL characters"
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return "Message is not valid UTF-8"
+    return None
+
+
+class CreatedMessage(NamedTuple):
+    """ID and timestamp of a queued message, like the rows returned by create_many"""
+    id: int
+    timestamp: datetime
+
+
+class MessageWriter:
+    """
+    Write-behind batching of new chat messages.
+
+    Messages submitted by all sockets of the worker are collected for up to max_delay_ms
+    or max_batch_size rows and written with one multi-row INSERT. Batches are written one
+    at a time in submission order, so the order of messages within a chat is preserved.
+
+    With an ID generator, IDs and timestamps are assigned in-process and enqueue returns
+    them right away, so the message can be broadcast before it is stored. A failed batch is
+    then retried, which cannot store a message twice since its ID is already fixed.
+
+    A batch that still fails is written row by row, so a single rejected message does not
+    take the rest of its batch down with it.
+    """
+
+    MAX_ATTEMPTS = 3
+    RETRY_DELAY = 0.1
+
+    def __init__(
+            self,
+            message_repository: MessageRepository,
+            max_delay_ms: float = 5,
+            max_batch_size: int = 500,
+            id_generator: Optional[SnowflakeGenerator] = None,
+    ):
+        self.message_repository = message_repository
+        self.max_delay = max_delay_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.id_generator = id_generator if id_generator is not None and id_generator.enabled else None
+
+        self._pending: Deque[Tuple[dict, Optional[asyncio.Future]]] = deque()
+        self._has_items = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._detached: Set[asyncio.Task] = set()
+        self._stopping = False
+
+        self.batches = 0
+        self.rows = 0
+        self.retries = 0
+        self.failed = 0
+
+    @property
+    def generates_ids(self) -> bool:
+        return self.id_generator is not None
+
+    async def submit(self, chat_id: int, sender_id: int, text: str) -> Row:
+        """Queue a message and wait until it is stored. Returns a row with id and timestamp."""
+        message = self._new_message(chat_id, sender_id, text)
+        if self._task is None or self._stopping:
+            created = await self.message_repository.create_many([message])
+            return created[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue(message, future)
+        return await future
+
+    def enqueue(self, chat_id: int, sender_id: int, text: str) -> CreatedMessage:
+        """
+        Queue a message without waiting for it to be stored, requires an ID generator.
+
+        Errors are retried and logged, they never reach the sender.
+        """
+        message = self._new_message(chat_id, sender_id, text)
+        if self._task is None:
+            task = asyncio.create_task(self._flush([(message, None)]))
+            self._detached.add(task)
+            task.add_done_callback(self._detached.discard)
+        else:
+            self._queue(message, None)
+        return CreatedMessage(message["id"], message["timestamp"])
+
+    def _new_message(self, chat_id: int, sender_id: int, text: str) -> dict:
+        error = text_error(text)
+        if error is not None:
+            raise ValueError(error)
+        message = {"chat_id": chat_id, "sender_id": sender_id, "text": text}
+        if self.id_generator is not None:
+            message["id"] = self.id_generator.next_id()
+            message["timestamp"] = SnowflakeGenerator.timestamp_of(message["id"])
+        return message
+
+    def _queue(self, message: dict, future: Optional[asyncio.Future]):
+        self._pending.append((message, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything that is still pending and stop the writer"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._has_items.set()
+        self._batch_full.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not (self._stopping and not self._pending):
+            await self._has_items.wait()
+            if len(self._pending) < self.max_batch_size and self.max_delay > 0 and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            count = min(len(self._pending), self.max_batch_size)
+            batch = [self._pending.popleft() for _ in range(count)]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._batch_full.clear()
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        messages = [message for message, _ in batch]
+        attempts = self.MAX_ATTEMPTS if self.id_generator is not None else 1
+        for attempt in range(attempts):
+            try:
+                created = await self.message_repository.create_many(messages)
+                break
+            except Exception as e:
+                if attempt + 1 < attempts:
+                    self.retries += 1
+                    await asyncio.sleep(self.RETRY_DELAY * 2 ** attempt)
+                    continue
+                if len(batch) > 1:
+                    # One rejected row fails the whole INSERT, store the rows one by one
+                    # so only the offending messages are lost
+                    for item in batch:
+                        await self._store_one(item)
+                    return
+                self._fail(batch, e)
+                return
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, future), row in zip(batch, created):
+            if future is not None and not future.done():
+                future.set_result(row)
+
+    async def _store_one(self, item: Tuple[dict, Optional[asyncio.Future]]):
+        message, future = item
+        try:
+            created = await self.message_repository.create_many([message])
+        except Exception as e:
+            self._fail([item], e)
+            return
+        self.rows += 1
+        if future is not None and not future.done():
+            future.set_result(created[0])
+
+    def _fail(self, batch: list, error: Exception):
+        self.failed += len(batch)
+        if any(future is None for _, future in batch):
+            print(f"Error storing {len(batch)} messages: {str(error)}")
+        for _, future in batch:
+            if future is not None and not future.done():
+                future.set_exception(error)
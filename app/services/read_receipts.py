@@ -0,0 +1,83 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from app.core.websocket_manager import ConnectionManager
+from app.repositories.chat_repository import ChatRepository
+
+# Highest message IDs kept per chat and user, the highest one stored in the chat is applied
+READ_RECEIPT_CANDIDATES = 8
+
+
+class ReadReceiptCoalescer:
+    """
+    Coalesces read receipts into per-(chat, user) read watermarks.
+
+    Receipts are collected for window_ms and each watermark is moved to the highest
+    message ID received for the chat and user that is stored in the chat, so an unknown
+    ID does not hide a valid lower one. Every watermark that moved is broadcast as a
+    single "read up to" event.
+    """
+
+    def __init__(self, chat_repository: ChatRepository, connection_manager: ConnectionManager, window_ms: float = 250):
+        self.chat_repository = chat_repository
+        self.connection_manager = connection_manager
+        self.window = window_ms / 1000
+
+        self._pending: Dict[Tuple[int, int], List[int]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.received = 0
+        self.flushed = 0
+
+    def submit(self, chat_id: int, reader_id: int, message_id: int):
+        """Record that reader_id has read everything up to message_id in the chat"""
+        self.received += 1
+        candidates = self._pending.setdefault((chat_id, reader_id), [])
+        if message_id in candidates:
+            return
+        candidates.append(message_id)
+        candidates.sort(reverse=True)
+        del candidates[READ_RECEIPT_CANDIDATES:]
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "received": self.received, "flushed": self.flushed}
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush pending receipts and stop"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not (self._stopping and not self._pending):
+            await self._wakeup.wait()
+            if not self._stopping:
+                await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            pending, self._pending = self._pending, {}
+            if pending:
+                await self._flush(pending)
+
+    async def _flush(self, pending: Dict[Tuple[int, int], List[int]]):
+        try:
+            advanced = await self.chat_repository.update_read_watermarks(pending)
+            self.flushed += len(advanced)
+            for chat_id, reader_id, message_id in advanced:
+                await self.connection_manager.broadcast_read_status(
+                    message_id=message_id,
+                    chat_id=chat_id,
+                    reader_id=reader_id
+                )
+        except Exception as e:
+            print(f"Error storing read receipts: {str(e)}")
@@ -0,0 +1,54 @@
+"""
+Publish-to-delivery latency of a broadcast backend.
+
+Publishes events one at a time and waits for each to come back on a subscription,
+so the numbers are round trips without queueing. Backends follow BROADCAST_BACKEND:
+
+    python -m benchmarks.bench_broadcast_latency --backend memory --events 5000
+    python -m benchmarks.bench_broadcast_latency --backend redis --events 5000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from broadcaster import Broadcast
+
+from app.core.config import settings
+from app.core.pubsub import PubSubBackend, get_broadcast_url
+from app.schemas.websocket_messages import ChatMessageOut
+
+
+async def run(url: str, events: int) -> dict:
+    payload = ChatMessageOut(id=1, sender_id=1, content="x" * 64, timestamp=time.time(), is_read=False).model_dump_json()
+    latencies = []
+    async with Broadcast(url) as broadcast:
+        async with broadcast.subscribe("bench:latency") as subscriber:
+            await asyncio.sleep(0.1)  # let the subscription reach the backend
+            for _ in range(events):
+                start = time.perf_counter()
+                await broadcast.publish(channel="bench:latency", message=payload)
+                await subscriber.get()
+                latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "events": events,
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=[backend.value for backend in PubSubBackend], default="memory")
+    parser.add_argument("--events", type=int, default=5_000)
+    args = parser.parse_args()
+
+    url = get_broadcast_url(args.backend, settings.REDIS_URL, settings.DATABASE_URL)
+    print(json.dumps(asyncio.run(run(url, args.events))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Cost of creating a chat as it grows: per-row path vs bulk path.
+
+The per-row path checks every user with its own query, adds participants one by one
+and reloads the relationships for the response. The bulk path checks all users with one
+query, inserts participants in one multi-row INSERT and builds the response from the request.
+
+    python -m benchmarks.bench_chat_create --sizes 2 100 5000
+"""
+import argparse
+import asyncio
+
+from app.models.chat import Chat, ChatType
+from app.models.chat_participant import ChatParticipant
+from app.repositories.chat_repository import ChatRepository, resolve_participant_ids
+from app.repositories.user_repository import UserRepository
+from benchmarks.common import measure, seed_users, setup_database
+
+
+async def main(sizes: list[int], repeat: int):
+    engine, session_factory = await setup_database()
+    users = await seed_users(engine, max(sizes))
+    chat_repository = ChatRepository(session_factory)
+    user_repository = UserRepository(session_factory)
+
+    async def per_row_create(participant_ids: list[int]) -> list[int]:
+        for user_id in participant_ids:
+            await user_repository.get_by_id(user_id)
+        async with session_factory() as session:
+            chat = Chat(name="bench", type=ChatType.group, creator_id=participant_ids[0])
+            session.add(chat)
+            await session.flush()
+            for user_id in participant_ids:
+                session.add(ChatParticipant(chat_id=chat.id, user_id=user_id))
+            await session.commit()
+            await session.refresh(chat, ["participants", "messages", "creator"])
+            return [participant.user_id for participant in chat.participants]
+
+    async def bulk_create(participant_ids: list[int]) -> list[int]:
+        member_ids = resolve_participant_ids(ChatType.group, participant_ids, participant_ids[0])
+        await user_repository.get_existing_ids(member_ids)
+        await chat_repository.create("bench", ChatType.group, member_ids, creator_id=participant_ids[0])
+        return member_ids
+
+    for size in sizes:
+        participant_ids = users[:size]
+        per_row = await measure(lambda: per_row_create(participant_ids), repeat=repeat)
+        bulk = await measure(lambda: bulk_create(participant_ids), repeat=repeat)
+        print(f"{size:>6} participants: per-row {per_row}  bulk {bulk}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 100, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
@@ -0,0 +1,60 @@
+"""
+Serialization microbenchmarks for WebSocket frames.
+
+Encodes ChatMessageOut and ReadStatusOut with every installed codec and compares
+two-pass inbound parsing (json.loads + model_validate) with one-pass validate_json:
+
+    python -m benchmarks.bench_codec --number 100000
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, UTC
+
+from app.core.codec import CODECS, decode_client_frame, get_codec
+from app.schemas.websocket_messages import ChatMessageIn, ChatMessageOut, ReadStatusIn, ReadStatusOut
+
+OUTBOUND = {
+    "ChatMessageOut": ChatMessageOut(
+        id=123456, sender_id=42, content="Hello, how are you doing today? " * 2,
+        timestamp=datetime.now(UTC), is_read=False, chat_id=7,
+    ),
+    "ReadStatusOut": ReadStatusOut(message_id=123456, reader_id=42, timestamp=datetime.now(UTC), chat_id=7),
+}
+
+INBOUND = {
+    "ChatMessageIn": (ChatMessageIn, '{"type":"message","content":"Hello, how are you doing today?","chat_id":7}'),
+    "ReadStatusIn": (ReadStatusIn, '{"type":"read_status","message_id":123456,"chat_id":7}'),
+}
+
+
+def ops_per_sec(func, number: int) -> float:
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    return round(number / seconds)
+
+
+def main(number: int):
+    print("encode, ops/s")
+    for name, model in OUTBOUND.items():
+        for codec_name in CODECS:
+            codec = get_codec(codec_name)
+            print(f"  {name:>15} {codec_name:>9}: {ops_per_sec(lambda: codec.dumps(model), number)}")
+
+    print("decode outbound payload (coalescing), ops/s")
+    payload = OUTBOUND["ReadStatusOut"].model_dump_json()
+    for codec_name in CODECS:
+        codec = get_codec(codec_name)
+        print(f"  {'ReadStatusOut':>15} {codec_name:>9}: {ops_per_sec(lambda: codec.loads(payload), number)}")
+
+    print("decode inbound frame, ops/s")
+    for name, (model, data) in INBOUND.items():
+        two_pass = ops_per_sec(lambda: model.model_validate(json.loads(data)), number)
+        one_pass = ops_per_sec(lambda: decode_client_frame(data), number)
+        print(f"  {name:>15}  two-pass: {two_pass}  validate_json: {one_pass}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.number)
@@ -0,0 +1,127 @@
+"""
+Compare per-socket subscriptions with the per-process fan-out hub.
+
+Runs every mode in a fresh subprocess so RSS numbers are not shared between runs.
+Uses the in-memory broadcast backend, so no Redis is required:
+
+    python -m benchmarks.bench_fanout --sockets 10000 --chats 100 --events 200
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+
+from broadcaster import Broadcast
+from starlette.websockets import WebSocketState
+
+from app.core.websocket_manager import ConnectionManager
+from app.schemas.websocket_messages import ChatMessageOut
+
+
+class FakeWebSocket:
+    """Minimal WebSocket stand-in that counts delivered frames"""
+
+    def __init__(self, counter: list):
+        self.client_state = WebSocketState.CONNECTED
+        self.application_state = WebSocketState.CONNECTED
+        self.counter = counter
+        self.scope = {"subprotocols": []}
+
+    async def accept(self, subprotocol: str | None = None):
+        pass
+
+    async def send_text(self, data: str):
+        self.counter[0] += 1
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        self.client_state = WebSocketState.DISCONNECTED
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def wait_for(counter: list, expected: int):
+    while counter[0] < expected:
+        await asyncio.sleep(0.001)
+
+
+async def run_per_socket(sockets: int, chats: int, events: int) -> dict:
+    """Old behaviour: every socket opens its own subscription to the chat channel"""
+    counter = [0]
+    async with Broadcast("memory://") as broadcast, AsyncExitStack() as stack:
+        tasks = []
+        for i in range(sockets):
+            websocket = FakeWebSocket(counter)
+            subscriber = await stack.enter_async_context(broadcast.subscribe(f"chat:{i % chats}"))
+
+            async def forward(subscriber=subscriber, websocket=websocket):
+                async for event in subscriber:
+                    await websocket.send_text(event.message)
+
+            tasks.append(asyncio.create_task(forward()))
+        result = await publish_events(broadcast, counter, sockets, chats, events)
+        for task in tasks:
+            task.cancel()
+        return result
+
+
+async def run_hub(sockets: int, chats: int, events: int) -> dict:
+    counter = [0]
+    async with Broadcast("memory://") as broadcast:
+        manager = ConnectionManager(broadcast)
+        for i in range(sockets):
+            await manager.connect(FakeWebSocket(counter), i % chats)
+        await asyncio.sleep(0.1)  # let the per-chat listeners subscribe
+        result = await publish_events(broadcast, counter, sockets, chats, events)
+        for websocket in list(manager.connections):
+            await manager.disconnect(websocket)
+        return result
+
+
+async def publish_events(broadcast: Broadcast, counter: list, sockets: int, chats: int, events: int) -> dict:
+    payload = ChatMessageOut(id=1, sender_id=1, content="x" * 64, timestamp=time.time(), is_read=False).model_dump_json()
+    expected = events * (sockets // chats)
+    start = time.perf_counter()
+    for i in range(events):
+        await broadcast.publish(channel=f"chat:{i % chats}", message=payload)
+    await wait_for(counter, expected)
+    elapsed = time.perf_counter() - start
+    return {
+        "published_per_sec": round(events / elapsed, 1),
+        "delivered_per_sec": round(expected / elapsed, 1),
+        "max_rss_mb": round(rss_mb(), 1),
+    }
+
+
+MODES = {"per_socket": run_per_socket, "hub": run_hub}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=10_000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--mode", choices=MODES)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = asyncio.run(MODES[args.mode](args.sockets, args.chats, args.events))
+        print(json.dumps(result))
+        return
+
+    for mode in MODES:
+        output = subprocess.check_output([
+            sys.executable, "-m", "benchmarks.bench_fanout", "--mode", mode,
+            "--sockets", str(args.sockets), "--chats", str(args.chats), "--events", str(args.events),
+        ])
+        print(f"{mode:>12}: {output.decode().strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Latency of history pages at increasing depth: OFFSET pagination vs keyset pagination.
+
+    python -m benchmarks.bench_history --messages 600000 --limit 50
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import desc, select
+
+from app.models.message import Message
+from app.repositories.message_repository import MessageRepository
+from benchmarks.common import measure, seed_chat, seed_users, setup_database
+
+
+async def main(messages: int, limit: int, pages: list[int]):
+    engine, session_factory = await setup_database()
+    users = await seed_users(engine, 2)
+    chat_id = await seed_chat(engine, users, messages)
+    repository = MessageRepository(session_factory)
+
+    async with session_factory() as session:
+        ids = (await session.execute(
+            select(Message.id).where(Message.chat_id == chat_id).order_by(desc(Message.id))
+        )).scalars().all()
+
+    async def offset_page(page: int):
+        async with session_factory() as session:
+            stmt = (
+                select(Message)
+                .where(Message.chat_id == chat_id)
+                .order_by(desc(Message.id))
+                .limit(limit)
+                .offset((page - 1) * limit)
+            )
+            return (await session.execute(stmt)).scalars().all()
+
+    for page in pages:
+        position = (page - 1) * limit
+        if position >= len(ids):
+            print(f"page {page}: skipped, chat has only {len(ids)} messages")
+            continue
+        before_id = ids[position - 1] if position else None
+        offset_result = await measure(lambda: offset_page(page), repeat=20)
+        keyset_result = await measure(lambda: repository.get_history(chat_id, limit=limit, before_id=before_id))
+        print(f"page {page:>6}: offset {offset_result}  keyset {keyset_result}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=600_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 1_000, 10_000])
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.limit, args.pages))
@@ -0,0 +1,39 @@
+"""
+Cost of a membership check as the chat grows: eager-loaded chat vs EXISTS query.
+
+    python -m benchmarks.bench_membership --messages 1000000
+"""
+import argparse
+import asyncio
+
+from app.repositories.chat_repository import ChatRepository
+from benchmarks.common import measure, seed_chat, seed_users, setup_database
+
+
+async def main(messages: int, repeat: int):
+    engine, session_factory = await setup_database()
+    users = await seed_users(engine, 2)
+    small_chat_id = await seed_chat(engine, users, 10)
+    large_chat_id = await seed_chat(engine, users, messages)
+    repository = ChatRepository(session_factory)
+    user_id = users[1]
+
+    async def eager_check(chat_id: int) -> bool:
+        chat = await repository.get_by_id(chat_id, load_relationships=True)
+        return any(participant.user_id == user_id for participant in chat.participants)
+
+    for label, chat_id in (("10 messages", small_chat_id), (f"{messages} messages", large_chat_id)):
+        eager = await measure(lambda: eager_check(chat_id), repeat=repeat)
+        participants = await measure(lambda: repository.get_by_id(chat_id, load_participants=True))
+        exists = await measure(lambda: repository.is_participant(chat_id, user_id))
+        print(f"{label:>18}: eager {eager}  participants only {participants}  exists {exists}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of the slow eager-loading path")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.repeat))
@@ -0,0 +1,56 @@
+"""
+Messages per second stored by one worker: per-message create vs the batching writer.
+
+    python -m benchmarks.bench_message_writer --senders 200 --messages 20
+"""
+import argparse
+import asyncio
+import time
+
+from app.repositories.message_repository import MessageRepository
+from app.services.message_writer import MessageWriter
+from benchmarks.common import seed_chat, seed_users, setup_database
+
+
+async def run_senders(senders: int, messages: int, send) -> float:
+    async def sender(index: int):
+        for i in range(messages):
+            await send(f"sender {index} message {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(index) for index in range(senders)))
+    return senders * messages / (time.perf_counter() - start)
+
+
+async def main(senders: int, messages: int, max_delay_ms: float, max_batch_size: int):
+    engine, session_factory = await setup_database()
+    users = await seed_users(engine, 2)
+    chat_id = await seed_chat(engine, users, 0)
+    repository = MessageRepository(session_factory)
+
+    before = await run_senders(
+        senders, messages,
+        lambda text: repository.create(chat_id=chat_id, sender_id=users[0], text=text, load_relationships=True),
+    )
+    print(f"per-message create: {before:,.0f} msgs/sec")
+
+    writer = MessageWriter(repository, max_delay_ms=max_delay_ms, max_batch_size=max_batch_size)
+    await writer.start()
+    after = await run_senders(
+        senders, messages,
+        lambda text: writer.submit(chat_id=chat_id, sender_id=users[0], text=text),
+    )
+    await writer.stop()
+    print(f"batching writer:    {after:,.0f} msgs/sec  {writer.stats()}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--senders", type=int, default=200, help="Concurrent sockets sending messages")
+    parser.add_argument("--messages", type=int, default=20, help="Messages sent by each socket")
+    parser.add_argument("--max-delay-ms", type=float, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.senders, args.messages, args.max_delay_ms, args.max_batch_size))
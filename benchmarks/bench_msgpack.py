@@ -0,0 +1,63 @@
+"""
+JSON vs MessagePack frames: payload size and encode cost.
+
+Compares frame sizes, the cost of re-encoding a broadcast JSON payload as MessagePack,
+and fan-out to binary sockets with one encode per event vs one encode per socket:
+
+    python -m benchmarks.bench_msgpack --sockets 1000 --number 20000
+"""
+import argparse
+import timeit
+from datetime import datetime, UTC
+
+from app.core.codec import codec, json_to_msgpack
+from app.core.websocket_manager import history_frame
+from app.schemas.websocket_messages import ChatMessageOut, ReadStatusOut
+
+
+def frames() -> dict:
+    message = ChatMessageOut(
+        id=123456, sender_id=42, content="Hello, how are you doing today?",
+        timestamp=datetime.now(UTC), is_read=False, chat_id=7,
+    )
+    read_status = ReadStatusOut(message_id=123456, reader_id=42, timestamp=datetime.now(UTC), chat_id=7)
+    history = history_frame(7, "[" + ",".join(codec.dumps(message) for _ in range(50)) + "]")
+    return {
+        "message": codec.dumps(message),
+        "read_status": codec.dumps(read_status),
+        "history_50": history,
+    }
+
+
+def microseconds(func, number: int) -> float:
+    return round(min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6, 2)
+
+
+def main(sockets: int, number: int):
+    print(f"{'frame':>12} {'json_bytes':>10} {'msgpack_bytes':>13} {'saved':>6} {'encode_us':>9}")
+    for name, payload in frames().items():
+        packed = json_to_msgpack(payload)
+        saved = 1 - len(packed) / len(payload.encode())
+        encode_us = microseconds(lambda: json_to_msgpack(payload), number // 10 if name == "history_50" else number)
+        print(f"{name:>12} {len(payload.encode()):>10} {len(packed):>13} {saved:>6.0%} {encode_us:>9}")
+
+    payload = frames()["message"]
+
+    def per_socket_encode():
+        return [json_to_msgpack(payload) for _ in range(sockets)]
+
+    def once_per_event():
+        packed = json_to_msgpack(payload)
+        return [packed for _ in range(sockets)]
+
+    per_socket = microseconds(per_socket_encode, max(number // sockets, 10))
+    once = microseconds(once_per_event, max(number // sockets, 10))
+    print(f"fan-out to {sockets} binary sockets: per socket {per_socket} us/event, once per event {once} us/event")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+    main(args.sockets, args.number)
@@ -0,0 +1,57 @@
+"""
+Time and allocations per 1,000 history rows: ORM entities vs projection rows,
+including the conversion into the response models used by the routes.
+
+    python -m benchmarks.bench_projection --rows 1000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app.repositories.message_repository import MessageRepository
+from app.schemas.message import MessageResponse
+from benchmarks.common import seed_chat, seed_users, setup_database
+
+
+async def profile(label: str, load, repeat: int):
+    await load()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await load()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    tracemalloc.start()
+    await load()
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    print(f"{label:>12}: {elapsed_ms:8.2f} ms  peak {peak / 1024:8.1f} KiB  live blocks {blocks}")
+
+
+async def main(rows: int, repeat: int):
+    engine, session_factory = await setup_database()
+    users = await seed_users(engine, 2)
+    chat_id = await seed_chat(engine, users, rows)
+    repository = MessageRepository(session_factory)
+
+    async def orm():
+        messages = await repository.get_history(chat_id, limit=rows, load_relationships=True)
+        return [MessageResponse.model_validate(message) for message in messages]
+
+    async def projection():
+        messages = await repository.get_history_rows(chat_id, limit=rows)
+        return [MessageResponse.model_validate(message) for message in messages]
+
+    await profile("orm", orm, repeat)
+    await profile("projection", projection, repeat)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,74 @@
+"""
+Full-text search latency on a large messages table (PostgreSQL only).
+
+Seeds messages spread over many chats, with words of different frequency, and times
+the chat search and the cross-chat search for rare, common and phrase queries:
+
+    python -m benchmarks.bench_search --messages 10000000 --chats 1000
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from app.repositories.message_repository import MessageRepository
+from benchmarks.common import measure, seed_chat, seed_users, setup_database
+
+QUERIES = {
+    # About messages / 100000 matches in the whole table
+    "rare word": "note{}",
+    # About messages / 1000 matches
+    "common word": "topic{}",
+    # Both words have to be adjacent
+    "phrase": '"alpha{} beta"',
+}
+
+
+async def seed_messages(engine, chat_ids: list[int], sender_id: int, count: int):
+    """Insert count messages round-robin into the chats, in batches of a million"""
+    batch = 1_000_000
+    for start in range(0, count, batch):
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "INSERT INTO messages (chat_id, sender_id, text, is_read) "
+                    "SELECT (CAST(:chat_ids AS int[]))[1 + g % cardinality(CAST(:chat_ids AS int[]))], :sender_id, "
+                    "'message ' || g || ' topic' || (g % 1000) || ' note' || (g % 100000) "
+                    "|| ' alpha' || (g % 50) || ' beta', false "
+                    "FROM generate_series(:start, :stop) AS g"
+                ),
+                {"chat_ids": chat_ids, "sender_id": sender_id, "start": start, "stop": min(start + batch, count) - 1},
+            )
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE messages"))
+
+
+async def main(messages: int, chats: int, limit: int, repeat: int):
+    engine, session_factory = await setup_database()
+    users = await seed_users(engine, 2)
+    chat_ids = [await seed_chat(engine, users, 0) for _ in range(chats)]
+    await seed_messages(engine, chat_ids, users[0], messages)
+    repository = MessageRepository(session_factory)
+    chat_id = chat_ids[0]
+
+    print(f"{messages} messages in {chats} chats, {limit} results per page")
+    for label, template in QUERIES.items():
+        query = template.format(7)
+        in_chat = await measure(lambda: repository.search(query, chat_id=chat_id, limit=limit), repeat=repeat)
+        all_chats = await measure(lambda: repository.search(query, user_id=users[1], limit=limit), repeat=repeat)
+        no_snippets = await measure(
+            lambda: repository.search(query, user_id=users[1], limit=limit, highlight=False), repeat=repeat,
+        )
+        print(f"{label:>12}: chat {in_chat}  all chats {all_chats}  all chats without snippets {no_snippets}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.chats, args.limit, args.repeat))
@@ -0,0 +1,85 @@
+"""
+Compare one broadcast channel per chat with hashed shard channels.
+
+A worker serving many small chats keeps one subscription per chat in the default mode,
+with sharding it keeps at most --shards. Every mode runs in a fresh subprocess.
+Uses the in-memory broadcast backend, so no Redis is required:
+
+    python -m benchmarks.bench_sharding --chats 50000 --events 20000 --shards 64 --pool 4
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+from broadcaster import Broadcast
+
+from app.core.pubsub import BroadcastPool
+from app.core.websocket_manager import ConnectionManager
+from app.schemas.websocket_messages import ChatMessageOut
+from benchmarks.bench_fanout import FakeWebSocket, rss_mb, wait_for
+
+
+async def run(chats: int, events: int, shards: int, pool_size: int) -> dict:
+    counter = [0]
+    async with Broadcast("memory://") as broadcast:
+        pool = BroadcastPool(broadcast, "memory://", size=pool_size)
+        await pool.connect()
+        manager = ConnectionManager(broadcast, broadcast_pool=pool, shard_count=shards)
+
+        start = time.perf_counter()
+        for chat_id in range(chats):
+            # Returns once the chat's channel is subscribed
+            await manager.connect(FakeWebSocket(counter), chat_id)
+        connect_seconds = time.perf_counter() - start
+
+        subscriptions = sum(len(member._backend._subscribed) for member in pool.members)
+        message = ChatMessageOut(id=1, sender_id=1, content="x" * 64, timestamp=time.time(), is_read=False)
+        start = time.perf_counter()
+        for i in range(events):
+            await manager.broadcast_message((i * 7919) % chats, message)
+        await wait_for(counter, events)
+        elapsed = time.perf_counter() - start
+
+        # Shares FakeWebSocket with bench_fanout, disconnect has to release every subscription
+        for websocket in list(manager.connections):
+            await manager.disconnect(websocket)
+        if manager.subscription_count():
+            raise RuntimeError(f"{manager.subscription_count()} subscriptions left after disconnecting every socket")
+        await pool.disconnect()
+        return {
+            "subscriptions": subscriptions,
+            "connect_seconds": round(connect_seconds, 3),
+            "delivered_per_sec": round(events / elapsed, 1),
+            "max_rss_mb": round(rss_mb(), 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=50_000)
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--shards", type=int, default=64)
+    parser.add_argument("--pool", type=int, default=4)
+    parser.add_argument("--mode", choices=("per_chat", "sharded"))
+    args = parser.parse_args()
+
+    if args.mode == "per_chat":
+        print(json.dumps(asyncio.run(run(args.chats, args.events, 0, 1))))
+        return
+    if args.mode == "sharded":
+        print(json.dumps(asyncio.run(run(args.chats, args.events, args.shards, args.pool))))
+        return
+
+    for mode in ("per_chat", "sharded"):
+        output = subprocess.check_output([
+            sys.executable, "-m", "benchmarks.bench_sharding", "--mode", mode, "--chats", str(args.chats),
+            "--events", str(args.events), "--shards", str(args.shards), "--pool", str(args.pool),
+        ])
+        print(f"{mode:>9}: {output.decode().strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Helpers shared by the database benchmarks.
+
+They use the same settings as the app, so DATABASE_URL, SECRET_KEY and REDIS_URL
+must be set. Every benchmark seeds its own users and chats and never deletes anything.
+"""
+import statistics
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+
+from app.core.db import Base, get_engine, get_session_factory
+# Import models so they are registered on Base.metadata
+from app.models import chat, chat_participant, message, user  # noqa: F401
+
+
+async def setup_database():
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, get_session_factory(engine)
+
+
+async def seed_users(engine, count: int) -> list[int]:
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text(
+                "INSERT INTO users (name, email, password) "
+                "SELECT 'bench ' || g, 'bench-' || md5(random()::text) || '@example.com', 'x' "
+                "FROM generate_series(1, :count) AS g RETURNING id"
+            ),
+            {"count": count},
+        )
+        return [row[0] for row in result]
+
+
+async def seed_chat(engine, participant_ids: list[int], messages: int) -> int:
+    """Create a group chat with the given participants and a number of messages"""
+    async with engine.begin() as conn:
+        chat_id = (await conn.execute(
+            text("INSERT INTO chats (name, type, creator_id) VALUES ('bench', 'group', :creator) RETURNING id"),
+            {"creator": participant_ids[0]},
+        )).scalar_one()
+        await conn.execute(
+            text("INSERT INTO chat_participants (chat_id, user_id) SELECT :chat_id, unnest(CAST(:ids AS int[]))"),
+            {"chat_id": chat_id, "ids": participant_ids},
+        )
+        if messages:
+            await conn.execute(
+                text(
+                    "INSERT INTO messages (chat_id, sender_id, text, is_read) "
+                    "SELECT :chat_id, :sender_id, 'benchmark message ' || g, false "
+                    "FROM generate_series(1, :count) AS g"
+                ),
+                {"chat_id": chat_id, "sender_id": participant_ids[0], "count": messages},
+            )
+        await conn.execute(text("ANALYZE messages"))
+        return chat_id
+
+
+async def measure(func: Callable[[], Awaitable], repeat: int = 50) -> dict:
+    """Run an async callable several times and return latency percentiles in milliseconds"""
+    await func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+    }
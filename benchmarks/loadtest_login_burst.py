@@ -0,0 +1,111 @@
+"""
+WebSocket delivery latency while the server handles a burst of logins.
+
+Runs against a live server (e.g. docker-compose up). A sender socket publishes a message
+every few milliseconds and a receiver socket in the same chat measures send-to-receive
+latency, first at rest and then while concurrent logins hit /users/login.
+
+    python -m benchmarks.loadtest_login_burst --url http://localhost:8000 --logins 200
+
+Needs the websockets client from requirements.txt (14 or newer, for additional_headers).
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import websockets
+
+
+def request(url: str, payload: dict, token: str | None = None) -> tuple[int, dict]:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+
+
+def create_user(base_url: str) -> tuple[int, str, str]:
+    email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+    _, user = request(f"{base_url}/users/", {"name": "load test", "email": email, "password": "12345678"})
+    _, token = request(f"{base_url}/users/login", {"email": email, "password": "12345678"})
+    return user["id"], email, token["access_token"]
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples), 2),
+        "p99_ms": round(samples[max(int(len(samples) * 0.99) - 1, 0)], 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+async def measure_latency(ws_url: str, sender_token: str, receiver_token: str, duration: float, interval: float) -> list[float]:
+    latencies = []
+    sent_at = {}
+    async with websockets.connect(ws_url, additional_headers={"Authorization": f"Bearer {sender_token}"}) as sender, \
+            websockets.connect(ws_url, additional_headers={"Authorization": f"Bearer {receiver_token}"}) as receiver:
+        await sender.recv()  # history
+        await receiver.recv()
+
+        async def receive():
+            async for frame in receiver:
+                data = json.loads(frame)
+                started = sent_at.pop(data.get("content"), None)
+                if started is not None:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        receive_task = asyncio.create_task(receive())
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            content = uuid.uuid4().hex
+            sent_at[content] = time.perf_counter()
+            await sender.send(json.dumps({"type": "message", "content": content}))
+            await asyncio.sleep(interval)
+        await asyncio.sleep(0.5)
+        receive_task.cancel()
+    return latencies
+
+
+async def main(base_url: str, logins: int, duration: float, interval: float):
+    loop = asyncio.get_running_loop()
+    sender_id, _, sender_token = await loop.run_in_executor(None, create_user, base_url)
+    receiver_id, email, receiver_token = await loop.run_in_executor(None, create_user, base_url)
+    _, chat = await loop.run_in_executor(None, lambda: request(
+        f"{base_url}/chats/",
+        {"name": "load test", "type": "personal", "participant_ids": [sender_id, receiver_id]},
+        sender_token,
+    ))
+    ws_url = base_url.replace("http", "ws", 1) + f"/ws/chat/{chat['id']}"
+
+    at_rest = await measure_latency(ws_url, sender_token, receiver_token, duration, interval)
+    print(f"at rest:      {percentiles(at_rest)}")
+
+    login = lambda: request(f"{base_url}/users/login", {"email": email, "password": "12345678"})[0]
+    burst = asyncio.gather(*(loop.run_in_executor(None, login) for _ in range(logins)))
+    during_burst = await measure_latency(ws_url, sender_token, receiver_token, duration, interval)
+    statuses = await burst
+    print(f"during burst: {percentiles(during_burst)}")
+    print(f"login statuses: { {code: statuses.count(code) for code in set(statuses)} }")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main(args.url.rstrip("/"), args.logins, args.duration, args.interval))
@@ -138,7 +138,7 @@ echo -e "\nSetup completed successfully!"
 # Test chat history endpoint (optional)
 echo -e "\nTesting chat history endpoint..."
 RESPONSE=$(curl -s -w "\n%{http_code}" -X 'GET' \
-  "http://localhost:$PORT/chats/history/$CHAT_ID?limit=10&offset=0" \
+  "http://localhost:$PORT/chats/history/$CHAT_ID?limit=10" \
   -H 'accept: application/json' \
   -H "Authorization: Bearer $BILLY_TOKEN")
 
@@ -162,6 +162,6 @@ echo -e "\nConnect to the WebSocket with one of these tokens in the header:"
 echo -e "Authorization: Bearer TOKEN"
 echo -e "----------------------------------------"
 echo -e "\nChat History API:"
-echo -e "GET http://localhost:$PORT/chats/history/$CHAT_ID?limit=10&offset=0"
+echo -e "GET http://localhost:$PORT/chats/history/$CHAT_ID?limit=10"
 echo -e "Authorization: Bearer TOKEN"
 echo -e "----------------------------------------"